@@ -5,9 +5,13 @@ import requests
 import yaml
 import logging.config as log_config
 from utils import *
-from devices.fmc import AdderFMC
+from devices.fmc import AdderFMC, load_fmc_instances, REQUESTS_EXCEPTIONS
 from devices.netbox import AdderNetbox
+from devices.sros import AdderSROS
+from devices.salt import AdderSalt
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pprint
+from typing import Any
 import argparse
 
 # Logging config
@@ -17,6 +21,7 @@ with open("./log/log.conf", "r") as f:
     except yaml.YAMLError:
         raise
     log_config.dictConfig(contents)
+    log_listener = queue_logging(contents["loggers"].keys())
 
 # Logging enable
 logger = logging.getLogger(__name__)
@@ -29,6 +34,26 @@ def deploy_fmc(fmc: AdderFMC) -> tuple[requests.Response, requests.Response]:
     return (dfw_response, ord_response)
 
 
+def deploy_all(fmcs: list[AdderFMC]) -> dict[str, str]:
+    """Deploys the pending changes on every FMC instance at the same time. A failure on one FMC doesn't stop the others.
+    Returns a short deploy status keyed by instance name."""
+    with ThreadPoolExecutor(max_workers=len(fmcs)) as executor:
+        fmc_jobs = {fmc.name: executor.submit(deploy_fmc, fmc) for fmc in fmcs}
+
+    results = {}
+    for name, job in fmc_jobs.items():
+        try:
+            job.result()
+        except (SomethingBroke, *REQUESTS_EXCEPTIONS) as e:
+            logger.error(f"Error deploying from FMC {name}: {e}")
+            results[name] = f"failed: {e}"
+        else:
+            results[name] = "deployed"
+        print(f"[{name}] Deploy: {results[name]}")
+
+    return results
+
+
 def parse_arguments() -> argparse.Namespace:
     """Here we parse all our arguments, get the values and return them so we can pass into the main func"""
     parser = argparse.ArgumentParser(
@@ -39,7 +64,7 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument(
         "--target",
         type=str,
-        help="The name of the object group you want to update. Defaults to 'Store-DIA-PROD'",
+        help="The name of the object group you want to update on every FMC. Defaults to the targets set for each FMC in adder.conf, or 'Store-DIA-PROD'",
     )
     parser.add_argument(
         "--site",
@@ -53,6 +78,55 @@ def parse_arguments() -> argparse.Namespace:
         help="Use this to manually specify the IP addresses you are trying to apply to the firewalls.",
         nargs="+",
     )
+    parser.add_argument(
+        "--literal",
+        help="Add the IP addresses to the object group as literals instead of creating host objects for them",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--sros",
+        help="Also push the IP addresses to the prefix-list on the SROS routers listed in adder.conf, alongside the FMC update",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--salt",
+        help="Also push the IP addresses to the firewalls of the Salt masters listed in adder.conf, alongside the FMC update",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--refresh-netbox",
+        help="Rebuild the local snapshot of site DIA addresses from Netbox before doing anything else",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--refresh-site",
+        type=str,
+        help="Drop these site codes from the local Netbox snapshot so their DIA addresses are looked up live. Can add multiple space-delimited site codes",
+        nargs="+",
+    )
+    parser.add_argument(
+        "--remove-site",
+        type=str,
+        help="Remove the DIA IP addresses of these site codes from the object groups. Can add multiple space-delimited site codes",
+        nargs="+",
+    )
+    parser.add_argument(
+        "--remove-ip",
+        type=str,
+        help="Remove these IP addresses from the object groups, whether they are in them as host objects or literals",
+        nargs="+",
+    )
+    parser.add_argument(
+        "--delete-orphans",
+        help="With --remove-site/--remove-ip, also delete the removed host objects if nothing else on the FMC uses them",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--where",
+        type=str,
+        help="Show every network group on the FMCs that contains these IP addresses, as a host object, a literal or through a nested group, then exit",
+        nargs="+",
+    )
     deploy_rollback_group.add_argument(
         "--deploy",
         help="Push pending changes from the FMC to the FTDs",
@@ -67,149 +141,414 @@ def parse_arguments() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def populate_site(
-    nb: AdderNetbox, fmc: AdderFMC, site_codes: list[str], target: str = None
-) -> None:
-    """Takes a list of site codes and adds the corresponding IP addresses to the firewall"""
-    new_sites = []
-    bad_sites = []
+def update_fmc(
+    fmc: AdderFMC, ips: list[str], target: str = None, literal: bool = False
+) -> tuple[list[str], list[str]]:
+    """Adds a list of validated IPs to the target object group on the FMC, or to every group in the instance's targets if
+    no target is given. Returns the IPs that were newly added, and the IPs that already existed as host objects
+    (or, with literal set, were already in every group)."""
     new_ips = []
     existing_ips = []
-    bad_ips = []
 
     if target == None:
-        obj_group = fmc.get_netgroup_uuid("Store-DIA-PROD")
+        obj_groups = [fmc.get_netgroup_uuid(name) for name in fmc.targets]
     else:
-        obj_group = fmc.get_netgroup_uuid(target)
+        obj_groups = [fmc.get_netgroup_uuid(target)]
 
-    for site_code in site_codes:
+    if literal:
+        for obj_group in obj_groups:
+            for ip in fmc.update_group_literals(obj_group, ips):
+                if ip not in new_ips:
+                    new_ips.append(ip)
+        existing_ips = [ip for ip in ips if ip not in new_ips]
+        return (new_ips, existing_ips)
+
+    for ip in ips:
         try:
-            validate_site_code(site_code)
-        except SiteCodeError:
-            logger.warning(f"Site Code Invalid: {site_code}")
-            bad_sites.append(site_code)
+            fmc.check_host_exists(ip)
+        except HostAlreadyExistsWarning:
+            existing_ips.append(ip)
         else:
-            logger.debug(f"Site Code to be added: {site_code}")
-            new_sites.append(site_code)
+            new_ips.append(ip)
 
-    for site_code in new_sites:
-        dia_ips = nb.get_dia_ip_addrs(site_code)
-        for ip in dia_ips:
-            logger.debug(f"Validating IP {ip} from site {site_code}")
-            try:
-                validate_ip(ip)
-            except InvalidIPArgumentError:
-                bad_ips.append(ip)
-                continue
+    group_objects = [fmc.get_host_by_name(ip) for ip in existing_ips]
+    if len(new_ips) >= 1:
+        group_objects.extend(fmc.create_host_objects(new_ips))
+
+    if len(group_objects) >= 1:
+        for obj_group in obj_groups:
+            fmc.update_object_group(obj_group, group_objects)
+
+    return (new_ips, existing_ips)
+
+
+def apply_changes(
+    fmcs: list[AdderFMC],
+    ips: list[str],
+    target: str = None,
+    literal: bool = False,
+    pushers: list | None = None,
+) -> tuple[dict[str, dict[str, Any]], dict[str, dict[str, str]]]:
+    """Updates every FMC instance at the same time, one worker each, while every other device pusher (SROS, Salt)
+    gets the same IPs in the background. A failure on one FMC doesn't stop the others. Returns a dict of FMC results
+    keyed by instance name, plus a dict of push results keyed by pusher name."""
+    if pushers is None:
+        pushers = []
+
+    with ThreadPoolExecutor(max_workers=len(pushers) + len(fmcs)) as executor:
+        push_jobs = {
+            pusher.name: executor.submit(pusher.push, ips) for pusher in pushers
+        }
+        fmc_jobs = {
+            fmc.name: executor.submit(
+                update_fmc, fmc, ips, target=target, literal=literal
+            )
+            for fmc in fmcs
+        }
 
+    fmc_results = {}
+    for name, job in fmc_jobs.items():
+        try:
+            new_ips, existing_ips = job.result()
+        except (SomethingBroke, *REQUESTS_EXCEPTIONS) as e:
+            logger.error(f"Error updating FMC {name}: {e}")
+            fmc_results[name] = {"error": str(e)}
+        else:
+            fmc_results[name] = {"new": new_ips, "existing": existing_ips}
+
+    push_results = {name: job.result() for name, job in push_jobs.items()}
+    return (fmc_results, push_results)
+
+
+def report_results(
+    fmc_results: dict[str, dict[str, Any]], push_results: dict[str, dict[str, str]]
+) -> None:
+    """Prints the outcome of apply_changes, one line per FMC instance and pusher"""
+    for name, result in fmc_results.items():
+        if "error" in result:
+            print(f"[{name}] Failed: {result['error']}")
+        else:
+            print(
+                f"[{name}] Newly Created IPs: {result['new']}\n[{name}] Already Existing IPs: {result['existing']}"
+            )
+        logger.debug("FMC %s results: %s", name, BodySummary(result))
+
+    for name, results in push_results.items():
+        print(f"{name} push results: {results}")
+
+
+def populate(
+    nb: AdderNetbox,
+    fmcs: list[AdderFMC],
+    site_codes: list[str] | None = None,
+    arg_ips: list[str] | None = None,
+    target: str = None,
+    literal: bool = False,
+    pushers: list | None = None,
+) -> list[str]:
+    """Takes a list of site codes and/or IPs and adds the addresses to the firewalls, and to any other devices in pushers.
+    Site codes are resolved through Netbox, and the IPs from both are merged so every device is changed once per run.
+    If literal is set, the IPs go into the object group as literals and no host objects are created. Returns the validated IPs.
+    """
+    bad_sites = []
+    valid_ips = []
+    bad_ips = []
+    candidate_ips = []
+
+    if site_codes is not None:
+        good_sites = []
+        for site_code in site_codes:
             try:
-                fmc.check_host_exists(ip)
-            except HostAlreadyExistsWarning:
-                existing_ips.append(ip)
+                validate_site_code(site_code)
+            except SiteCodeError:
+                logger.warning(f"Site Code Invalid: {site_code}")
+                bad_sites.append(site_code)
             else:
-                new_ips.append(ip)
+                logger.debug(f"Site Code to be added: {site_code}")
+                good_sites.append(site_code)
 
-    if len(existing_ips) >= 1:
-        for ip in existing_ips:
-            fmc.update_group_from_existing_host(obj_group, ip)
+        for site_code, dia_ips in nb.get_sites_dia_ip_addrs(good_sites).items():
+            logger.debug("IPs from site %s: %s", site_code, BodySummary(dia_ips))
+            candidate_ips.extend(dia_ips)
 
-    if len(new_ips) >= 1:
-        new_objects = fmc.create_host_objects(new_ips)
-        fmc.update_object_group(obj_group, new_objects)
-        logger.debug(
-            f"\nNewly added sites: {site_codes}\nNewly Created IPs from sites: {new_ips}\nAlready Existing IPs from sites: {existing_ips}\nInvalid IPs: {bad_ips}. Check netbox!\n"
-        )
-    print(
-        f"\nNewly added sites: {site_codes}\nNewly Created IPs from sites: {new_ips}\nAlready Existing IPs from sites: {existing_ips}\nInvalid IPs: {bad_ips}. Check netbox!\n"
+    if arg_ips is not None:
+        candidate_ips.extend(arg_ips)
+
+    for ip in candidate_ips:
+        logger.debug("Validating IP passed to adder: %s", ip)
+        try:
+            validate_ip(ip)
+        except InvalidIPArgumentError:
+            bad_ips.append(ip)
+            continue
+        if ip not in valid_ips:
+            valid_ips.append(ip)
+
+    fmc_results, push_results = apply_changes(
+        fmcs, valid_ips, target=target, literal=literal, pushers=pushers
+    )
+
+    logger.debug(
+        "\nNewly added sites: %s\nInvalid sites: %s\nValid IPs: %s\nInvalid IPs: %s. Check netbox!\n",
+        BodySummary(site_codes),
+        BodySummary(bad_sites),
+        BodySummary(valid_ips),
+        BodySummary(bad_ips),
     )
+    if site_codes is not None:
+        print(
+            f"\nNewly added sites: {site_codes}\nInvalid sites: {bad_sites}\nInvalid IPs: {bad_ips}. Check netbox!"
+        )
+    else:
+        print(f"\nInvalid IPs: {bad_ips}")
+    report_results(fmc_results, push_results)
+    print()
 
+    return valid_ips
 
-def populate_from_single(fmc: AdderFMC, arg_ips: list, target: str = None) -> None:
-    """Skip the netbox! This lets you enter a list of IPs into adder and have them added to the FMC"""
-    existing_ips = []
-    new_ips = []
-    bad_ips = []
+
+def remove_from_fmc(
+    fmc: AdderFMC, ips: list[str], target: str = None, delete_orphans: bool = False
+) -> tuple[list[str], list[str]]:
+    """Strips a list of validated IPs out of the target object group on the FMC, or out of every group in the instance's
+    targets if no target is given. With delete_orphans set, host objects that are no longer used anywhere are deleted too.
+    Returns the IPs that were removed, and the names of the host objects that were deleted.
+    """
+    removed_ips = []
+    removed_objects = []
 
     if target == None:
-        obj_group = fmc.get_netgroup_uuid("Store-DIA-PROD")
+        obj_groups = [fmc.get_netgroup_uuid(name) for name in fmc.targets]
     else:
-        obj_group = fmc.get_netgroup_uuid(target)
+        obj_groups = [fmc.get_netgroup_uuid(target)]
 
-    for ip in arg_ips:
-        logger.debug(f"Validating IP passed to adder: {ip}")
+    for obj_group in obj_groups:
+        try:
+            group_objects, group_literals = fmc.remove_from_object_group(obj_group, ips)
+        except EmptyObjectGroupError as e:
+            logger.warning(f"Skipping object group on FMC {fmc.name}: {e}")
+            continue
+        removed_objects.extend(group_objects)
+        for name in [obj.name for obj in group_objects] + group_literals:
+            if name not in removed_ips:
+                removed_ips.append(name)
+
+    deleted_hosts = []
+    if delete_orphans and len(removed_objects) >= 1:
+        deleted_hosts = [obj.name for obj in fmc.delete_host_objects(removed_objects)]
+
+    return (removed_ips, deleted_hosts)
+
+
+def decommission(
+    nb: AdderNetbox,
+    fmcs: list[AdderFMC],
+    site_codes: list[str] | None = None,
+    arg_ips: list[str] | None = None,
+    target: str = None,
+    delete_orphans: bool = False,
+) -> list[str]:
+    """Takes a list of site codes and/or IPs and removes the addresses from the object groups on every FMC at the same time,
+    one GET and one PUT per group, plus a filtered lookup per IP for groups holding renamed host objects. Site codes are resolved
+    through Netbox. Returns the validated IPs.
+    """
+    bad_sites = []
+    valid_ips = []
+    bad_ips = []
+    candidate_ips = list(arg_ips) if arg_ips is not None else []
+
+    if site_codes is not None:
+        good_sites = []
+        for site_code in site_codes:
+            try:
+                validate_site_code(site_code)
+            except SiteCodeError:
+                logger.warning(f"Site Code Invalid: {site_code}")
+                bad_sites.append(site_code)
+            else:
+                good_sites.append(site_code)
 
+        for site_code, dia_ips in nb.get_sites_dia_ip_addrs(good_sites).items():
+            candidate_ips.extend(dia_ips)
+
+    for ip in candidate_ips:
         try:
-            _ = validate_ip(ip)
+            validate_ip(ip)
         except InvalidIPArgumentError:
             bad_ips.append(ip)
             continue
+        if ip not in valid_ips:
+            valid_ips.append(ip)
+
+    with ThreadPoolExecutor(max_workers=len(fmcs)) as executor:
+        fmc_jobs = {
+            fmc.name: executor.submit(
+                remove_from_fmc,
+                fmc,
+                valid_ips,
+                target=target,
+                delete_orphans=delete_orphans,
+            )
+            for fmc in fmcs
+        }
 
+    print(f"\nInvalid sites: {bad_sites}\nInvalid IPs: {bad_ips}")
+    for name, job in fmc_jobs.items():
         try:
-            fmc.check_host_exists(ip)
-        except HostAlreadyExistsWarning:
-            existing_ips.append(ip)
-        else:
-            new_ips.append(ip)
-
-    if len(existing_ips) >= 1:
-        for ip in existing_ips:
-            fmc.update_group_from_existing_host(obj_group, ip)
-
-    if len(new_ips) >= 1:
-        new_objects = fmc.create_host_objects(new_ips)
-        fmc.update_object_group(obj_group, new_objects)
+            removed_ips, deleted_hosts = job.result()
+        except (SomethingBroke, *REQUESTS_EXCEPTIONS) as e:
+            logger.error(f"Error removing IPs from FMC {name}: {e}")
+            print(f"[{name}] Failed: {e}")
+            continue
         logger.debug(
-            f"Newly Created IPs: {new_ips}\nAlready Existing IPs: {existing_ips}\nInvalid IPs: {bad_ips}"
+            "FMC %s removed IPs: %s, deleted hosts: %s",
+            name,
+            BodySummary(removed_ips),
+            BodySummary(deleted_hosts),
         )
-    print(
-        f"\nNewly Created IPs: {new_ips}\nAlready Existing IPs: {existing_ips}\nInvalid IPs: {bad_ips}\n"
-    )
+        print(
+            f"[{name}] Removed IPs: {removed_ips}\n[{name}] Deleted host objects: {deleted_hosts}"
+        )
+    print()
+
+    return valid_ips
+
+
+def where(fmcs: list[AdderFMC], arg_ips: list[str]) -> dict[str, dict[str, list[str]]]:
+    """Answers which network groups on every FMC contain each of the IPs, directly or through nested groups.
+    The membership index for each instance is built concurrently. Returns the results keyed by instance name.
+    """
+    with ThreadPoolExecutor(max_workers=len(fmcs)) as executor:
+        fmc_jobs = {
+            fmc.name: executor.submit(fmc.get_groups_containing, arg_ips)
+            for fmc in fmcs
+        }
+
+    results = {}
+    for name, job in fmc_jobs.items():
+        try:
+            results[name] = job.result()
+        except (SomethingBroke, *REQUESTS_EXCEPTIONS) as e:
+            logger.error(f"Error building membership index for FMC {name}: {e}")
+            print(f"[{name}] Failed: {e}")
+            continue
+
+        for ip, groups in results[name].items():
+            print(
+                f"[{name}] {ip}: {', '.join(groups) if groups else 'not in any group'}"
+            )
+
+    return results
 
 
 def rollback_fmc(fmc: AdderFMC) -> None:
     print("MOCK FUNC: rollback_fmc()")
 
 
-def main(args) -> None:
-    # Establish API connection object to FMC
-    fmc = AdderFMC()
+def connect_fmcs() -> list[AdderFMC]:
+    """Builds an AdderFMC for every instance in adder.conf, logging in to all of them at the same time.
+    Credentials are asked for once and shared by every instance. An instance that can't be reached is reported
+    and left out, and the run carries on with the rest."""
+    instances = load_fmc_instances()
+    if len(instances) == 0:
+        raise SomethingBroke("adder.conf", message="No FMC instances configured")
 
-    # Establish API connection object to Netbox
-    nb = AdderNetbox()
+    creds = AdderFMC.get_creds()
+    with ThreadPoolExecutor(max_workers=len(instances)) as executor:
+        fmc_jobs = {
+            instance["name"]: executor.submit(AdderFMC, creds=creds, **instance)
+            for instance in instances
+        }
+
+    fmcs = []
+    for name, job in fmc_jobs.items():
+        try:
+            fmcs.append(job.result())
+        except (SomethingBroke, *REQUESTS_EXCEPTIONS) as e:
+            logger.error(f"Error connecting to FMC {name}: {e}")
+            print(f"[{name}] Failed to connect: {e}")
 
+    if len(fmcs) == 0:
+        raise SomethingBroke("adder.conf", message="Could not connect to any FMC")
+
+    return fmcs
+
+
+def check_pending_changes(fmc: AdderFMC) -> None:
+    """Warn the user and wait for confirmation if the FTDs on an FMC already have changes waiting to be deployed"""
     deployable_devices = fmc.get_deployable_devices()
-    for device in deployable_devices.json()["items"]:
-        if device["name"] == fmc.ord_ftd:
+    for device in deployable_devices:
+        if device.name == fmc.ord_ftd:
             input(
-                "The ORD FTD already has pending changes. ENTER to proceed, Ctrl-C to exit."
+                f"[{fmc.name}] The ORD FTD already has pending changes. ENTER to proceed, Ctrl-C to exit."
             )
             break
 
-    for device in deployable_devices.json()["items"]:
-        if device["name"] == fmc.dfw_ftd:
+    for device in deployable_devices:
+        if device.name == fmc.dfw_ftd:
             input(
-                "The DFW FTD already has pending changes. ENTER to proceed, Ctrl-C to exit."
+                f"[{fmc.name}] The DFW FTD already has pending changes. ENTER to proceed, Ctrl-C to exit."
             )
             break
 
-    if args.site is not None:
-        if args.target is not None:
-            populate_site(nb, fmc, args.site, target=args.target)
-        else:
-            populate_site(nb, fmc, args.site)
 
-    if args.ip is not None:
-        populate_from_single(fmc, args.ip, target=args.target)
-        if args.deploy:
-            deploy_fmc(fmc)
+def main(args) -> None:
+    # Establish API connection objects to every FMC
+    fmcs = connect_fmcs()
+
+    if args.where is not None:
+        where(fmcs, args.where)
+        return
+
+    # Establish API connection object to Netbox
+    nb = AdderNetbox()
+    if args.refresh_site is not None:
+        nb.invalidate_sites(args.refresh_site)
+    if args.site is not None or args.remove_site is not None or args.refresh_netbox:
+        nb.sync_snapshot(force=args.refresh_netbox)
+
+    for fmc in fmcs:
+        check_pending_changes(fmc)
+
+    pushers = []
+    if args.sros:
+        pushers.append(AdderSROS())
+    if args.salt:
+        pushers.append(AdderSalt())
+
+    try:
+        if args.site is not None or args.ip is not None:
+            populate(
+                nb,
+                fmcs,
+                site_codes=args.site,
+                arg_ips=args.ip,
+                target=args.target,
+                literal=args.literal,
+                pushers=pushers,
+            )
+    finally:
+        for pusher in pushers:
+            pusher.close()
+
+    if args.remove_site is not None or args.remove_ip is not None:
+        decommission(
+            nb,
+            fmcs,
+            site_codes=args.remove_site,
+            arg_ips=args.remove_ip,
+            target=args.target,
+            delete_orphans=args.delete_orphans,
+        )
 
     if args.deploy:
-        deploy_fmc(fmc)
+        deploy_all(fmcs)
     elif args.rollback:
-        rollback_fmc(fmc)
+        for fmc in fmcs:
+            rollback_fmc(fmc)
 
 
 if __name__ == "__main__":
     args = parse_arguments()
     logger.debug(f"Arguments Passed: {args}")
-    main(args)
\ No newline at end of file
+    main(args)
@@ -1,13 +1,19 @@
 from __future__ import annotations
 from utils import *
-from typing import Any
+from devices.models import *
+from typing import Any, Callable
 from datetime import datetime, timedelta
 from getpass import getpass
 from configparser import ConfigParser
 from pprint import pprint
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+import ipaddress
 import json
 import requests
 import logging
+import random
+import time
 import uuid
 import urllib3
 
@@ -22,9 +28,24 @@ config = ConfigParser()
 config.read("adder.conf")
 
 # Define Constants
-FMC_HOST: str = config["fmc"]["host"]
-DFW_FTD: str = config["fmc"]["dfw_ftd"]
-ORD_FTD: str = config["fmc"]["ord_ftd"]
+FMC_HOST: str = config.get("fmc", "host", fallback="None")
+DFW_FTD: str = config.get("fmc", "dfw_ftd", fallback="None")
+ORD_FTD: str = config.get("fmc", "ord_ftd", fallback="None")
+# Page size and number of concurrent page requests when pulling every network group
+GROUP_PAGE_SIZE: int = 100
+GROUP_FETCH_WORKERS: int = 4
+# Number of object IDs sent in a single bulk DELETE
+DELETE_BATCH_SIZE: int = 100
+# Whether group updates are checked for concurrent overwrites from other runs, how many times such an update is retried,
+# and how long to wait before checking
+VERIFY_GROUP_UPDATES: bool = config.getboolean(
+    "fmc", "verify_group_updates", fallback=False
+)
+GROUP_UPDATE_ATTEMPTS: int = config.getint("fmc", "group_update_attempts", fallback=8)
+GROUP_VERIFY_DELAY: float = config.getfloat("fmc", "group_verify_delay", fallback=1.0)
+# The FMC REST API allows 120 requests per minute per user
+FMC_RATE_LIMIT: int = config.getint("fmc", "rate_limit", fallback=120)
+DEFAULT_TARGET: str = "Store-DIA-PROD"
 REQUESTS_EXCEPTIONS = (
     requests.RequestException,
     requests.ConnectionError,
@@ -35,25 +56,104 @@ REQUESTS_EXCEPTIONS = (
 )
 
 
+def load_fmc_instances() -> list[dict[str, Any]]:
+    """Reads every FMC instance out of adder.conf. The [fmc] section is the default instance, and any number of
+    extra instances can be added as [fmc:<name>] sections with the same keys. Returns a list of keyword
+    arguments for the AdderFMC constructor. A section missing one of the FTD names is reported and skipped.
+    """
+    instances: list[dict[str, Any]] = []
+
+    for section in config.sections():
+        if section == "fmc":
+            name = "fmc"
+        elif section.startswith("fmc:"):
+            name = section[len("fmc:") :]
+        else:
+            continue
+
+        if config.get(section, "host", fallback="None") == "None":
+            logger.debug(f"No host set in [{section}]. Skipping.")
+            continue
+
+        missing = [
+            key for key in ("dfw_ftd", "ord_ftd") if not config.has_option(section, key)
+        ]
+        if len(missing) >= 1:
+            logger.error(f"[{section}] is missing {', '.join(missing)}. Skipping.")
+            continue
+
+        targets = config.get(section, "targets", fallback=DEFAULT_TARGET)
+        instances.append(
+            {
+                "name": name,
+                "host": config[section]["host"],
+                "dfw_ftd": config[section]["dfw_ftd"],
+                "ord_ftd": config[section]["ord_ftd"],
+                "domain": config.get(section, "domain", fallback=None),
+                "targets": [t.strip() for t in targets.split(",") if t.strip()],
+                "rate_limit": config.getint(
+                    section, "rate_limit", fallback=FMC_RATE_LIMIT
+                ),
+                "verify_updates": config.getboolean(
+                    section, "verify_group_updates", fallback=VERIFY_GROUP_UPDATES
+                ),
+            }
+        )
+
+    return instances
+
+
 class AdderFMC:
-    def __init__(self):
-        self.host: str = FMC_HOST
-        self._creds: tuple[str, str] = self.get_creds()
+    def __init__(
+        self,
+        name: str = "fmc",
+        host: str = FMC_HOST,
+        dfw_ftd: str = DFW_FTD,
+        ord_ftd: str = ORD_FTD,
+        domain: str | None = None,
+        targets: list[str] | None = None,
+        rate_limit: int = FMC_RATE_LIMIT,
+        creds: tuple[str, str] | None = None,
+        verify_updates: bool = VERIFY_GROUP_UPDATES,
+    ):
+        self.name: str = name
+        self.host: str = host
+        self._creds: tuple[str, str] = creds if creds is not None else self.get_creds()
+        self.session: requests.Session = requests.Session()
+        self.session.verify = False
+        self.request_interval: float = 60 / rate_limit
+        self.next_request: float = 0.0
+        self._rate_lock: Lock = Lock()
 
         try:
-            _tokens: dict[str, str] = self.get_tokens()
-        except REQUESTS_EXCEPTIONS as e:
-            logger.error(f"FMC_CONSTRUCTOR: Failed to connect to FMC: {e}")
+            _tokens: dict[str, str] = self.get_tokens(domain)
+        except (SomethingBroke, *REQUESTS_EXCEPTIONS) as e:
+            logger.error(f"FMC_CONSTRUCTOR: Failed to connect to FMC {name}: {e}")
             raise
 
         self.auth_token: str = _tokens["auth"]
         self.refresh_token: str = _tokens["refresh"]
         self.domain_uuid: str = _tokens["domain_uuid"]
         self.token_expire: datetime = datetime.now() + timedelta(minutes=30)
-        self.dfw_ftd: str = DFW_FTD
-        self.ord_ftd: str = ORD_FTD
+        self.dfw_ftd: str = dfw_ftd
+        self.ord_ftd: str = ord_ftd
+        self.targets: list[str] = targets if targets else [DEFAULT_TARGET]
+        self.verify_updates: bool = verify_updates
+        self.hosts: dict[str, NetworkObject] | None = None
+        self.host_lookups: dict[str, list[NetworkObject]] = {}
+        self.netgroups: dict[str, NetworkGroup] | None = None
+        self.membership_index: dict[str, list[str]] | None = None
         self.uri_base: str = f"/api/fmc_config/v1/domain/{self.domain_uuid}"
-        logger.debug("Connection to FMC established")
+        logger.debug(f"Connection to FMC {name} established")
+
+    def wait_for_rate_limit(self) -> None:
+        """Spaces out the requests made by this instance so it stays under its per-minute rate limit"""
+        with self._rate_lock:
+            now = time.monotonic()
+            wait = self.next_request - now
+            self.next_request = max(now, self.next_request) + self.request_interval
+        if wait > 0:
+            time.sleep(wait)
 
     def get(
         self,
@@ -63,10 +163,11 @@ class AdderFMC:
         body: dict[str, Any] | list[dict[str, Any]] | None = None,
     ) -> requests.Response:
         """Wraps a requests.get method call in the formatting necessary to talk to FMC API"""
+        self.wait_for_rate_limit()
 
         if url is not None:
             logger.debug(f"GET decision: overriding GET request with {url}")
-            r: requests.Response = requests.get(
+            r: requests.Response = self.session.get(
                 url,
                 headers=self.get_auth_header(),
                 params=payload,
@@ -80,7 +181,7 @@ class AdderFMC:
                 raise StatusCodeError(r.status_code, r.text)
         else:
             logger.debug(f"GET decision: no override URL provided")
-            r: requests.Response = requests.get(
+            r: requests.Response = self.session.get(
                 f"{self.host}{uri}",
                 params=payload,
                 headers=self.get_auth_header(),
@@ -101,29 +202,30 @@ class AdderFMC:
         url: str | None = None,
     ) -> requests.Response:
         """Wraps a requests.post method call in the formatting necessary to talk to FMC API"""
+        self.wait_for_rate_limit()
 
         if url is not None:
-            r: requests.Response = requests.post(
+            r: requests.Response = self.session.post(
                 url,
                 headers=self.get_auth_header(),
                 params=payload,
                 json=body,
                 verify=False,
             )
-            logger.debug(f"Making post request: {r.request.body}")
+            logger.debug("Making post request: %s", BodySummary(r.request.body))
             if 200 <= r.status_code <= 299:
                 return r
             else:
                 raise StatusCodeError(r.status_code, r.text)
         else:
-            r: requests.Response = requests.post(
+            r: requests.Response = self.session.post(
                 f"{self.host}{uri}",
                 headers=self.get_auth_header(),
                 params=payload,
                 json=body,
                 verify=False,
             )
-            logger.debug(f"Making post request: {r.request.body}")
+            logger.debug("Making post request: %s", BodySummary(r.request.body))
             if 200 <= r.status_code <= 299:
                 return r
             else:
@@ -137,40 +239,80 @@ class AdderFMC:
         url: str | None = None,
     ) -> requests.Response:
         """Wraps a requests.put method call in the formatting necessary to talk to FMC API"""
+        self.wait_for_rate_limit()
 
         if url is not None:
-            r: requests.Response = requests.put(
+            r: requests.Response = self.session.put(
                 url,
                 headers=self.get_auth_header(),
                 params=payload,
                 json=body,
                 verify=False,
             )
-            logger.debug(f"Making put request: {r.request.body}")
+            logger.debug("Making put request: %s", BodySummary(r.request.body))
             if 200 <= r.status_code <= 299:
                 return r
             else:
                 raise StatusCodeError(r.status_code, r.text)
         else:
-            r: requests.Response = requests.put(
+            r: requests.Response = self.session.put(
                 f"{self.host}{uri}",
                 headers=self.get_auth_header(),
                 params=payload,
                 json=body,
                 verify=False,
             )
-            logger.debug(f"Making put request: {r.request.body}")
+            logger.debug("Making put request: %s", BodySummary(r.request.body))
+            if 200 <= r.status_code <= 299:
+                return r
+            else:
+                raise StatusCodeError(r.status_code, r.text)
+
+    def delete(
+        self,
+        uri: str,
+        payload: dict[str, Any] | None = None,
+        url: str | None = None,
+    ) -> requests.Response:
+        """Wraps a requests.delete method call in the formatting necessary to talk to FMC API"""
+        self.wait_for_rate_limit()
+
+        if url is not None:
+            r: requests.Response = self.session.delete(
+                url,
+                headers=self.get_auth_header(),
+                params=payload,
+                verify=False,
+            )
+            logger.debug(f"Making delete request to {url}")
             if 200 <= r.status_code <= 299:
                 return r
             else:
                 raise StatusCodeError(r.status_code, r.text)
+        else:
+            r: requests.Response = self.session.delete(
+                f"{self.host}{uri}",
+                headers=self.get_auth_header(),
+                params=payload,
+                verify=False,
+            )
+            logger.debug(f"Making delete request to {uri}")
+            if 200 <= r.status_code <= 299:
+                return r
+            else:
+                raise StatusCodeError(r.status_code, r.text)
+
+    def get_all_hosts(self, refresh: bool = False) -> dict[str, NetworkObject]:
+        """Returns a dictionary with object names as keys, and the parsed objects as values.
+        The inventory is fetched once and cached on the instance; pass refresh=True to fetch it again.
+        """
+        if self.hosts is not None and not refresh:
+            return self.hosts
 
-    def get_all_hosts(self) -> dict[str, str]:
-        """Returns a dictionary with object names as keys, and their UUIDs as values"""
-        all_hosts: dict[str, str] = {}
+        all_hosts: dict[str, NetworkObject] = {}
         url: str | None = None
         uri: str = f"{self.uri_base}/object/networkaddresses"
-        payload: dict[str, int] | None = {"limit": 1000}
+        payload: dict[str, Any] | None = {"limit": 1000, "expanded": True}
 
         while True:
             try:
@@ -179,20 +321,116 @@ class AdderFMC:
                 logger.error(f"Error retrieving list of network addresses: {e}")
                 raise
 
-            for item in r.json()["items"]:
-                all_hosts[item["name"]] = item["id"]
+            page = parse_response(r)
+            for item in page.get("items", []):
+                all_hosts[item["name"]] = NetworkObject.from_json(item)
 
-            if "next" in r.json()["paging"].keys():
-                url = r.json()["paging"]["next"][0]
+            if "next" in page["paging"].keys():
+                url = page["paging"]["next"][0]
                 payload = None
             else:
                 break
 
+        logger.debug(f"Network address inventory loaded: {len(all_hosts)} objects")
+        self.hosts = all_hosts
         return all_hosts
 
+    def get_all_netgroups(self, refresh: bool = False) -> dict[str, NetworkGroup]:
+        """Returns a dictionary with network group UUIDs as keys, and the expanded, parsed groups as values.
+        The first page tells us how many groups there are, and the rest of the pages are then fetched concurrently.
+        The groups are cached on the instance; pass refresh=True to fetch them again."""
+        if self.netgroups is not None and not refresh:
+            return self.netgroups
+
+        uri: str = f"{self.uri_base}/object/networkgroups"
+
+        def get_page(offset: int) -> dict[str, Any]:
+            payload = {"expanded": True, "limit": GROUP_PAGE_SIZE, "offset": offset}
+            try:
+                return parse_response(self.get(uri, payload))
+            except StatusCodeError as e:
+                logger.error(f"Error retrieving list of network groups: {e}")
+                raise
+
+        first_page = get_page(0)
+        pages: list[dict[str, Any]] = [first_page]
+        count: int = first_page["paging"].get("count", 0)
+        offsets = list(range(GROUP_PAGE_SIZE, count, GROUP_PAGE_SIZE))
+        if len(offsets) >= 1:
+            with ThreadPoolExecutor(max_workers=GROUP_FETCH_WORKERS) as executor:
+                pages.extend(executor.map(get_page, offsets))
+
+        netgroups: dict[str, NetworkGroup] = {}
+        for page in pages:
+            for item in page.get("items", []):
+                netgroups[item["id"]] = NetworkGroup(item)
+
+        logger.debug(f"Network groups loaded: {len(netgroups)} groups")
+        self.netgroups = netgroups
+        return netgroups
+
+    def get_membership_index(self, refresh: bool = False) -> dict[str, list[str]]:
+        """Builds a reverse index of every network group on the FMC: IP (or other object value) as keys, and the names of
+        every group that contains it as values. Members of nested groups count as members of the groups they are nested in.
+        The index is cached on the instance along with the host inventory and the groups it is built from.
+        """
+        if self.membership_index is not None and not refresh:
+            return self.membership_index
+
+        netgroups = self.get_all_netgroups(refresh=refresh)
+        values_by_id: dict[str, str] = {
+            host.id: host.value
+            for host in self.get_all_hosts(refresh=refresh).values()
+            if host.value is not None
+        }
+        resolved: dict[str, set[str]] = {}
+
+        def resolve(group_id: str, seen: set[str]) -> set[str]:
+            if group_id in resolved:
+                return resolved[group_id]
+            group = netgroups.get(group_id)
+            if group is None or group_id in seen:
+                return set()
+            seen = seen | {group_id}
+
+            members: set[str] = {literal["value"] for literal in group.literals}
+            for obj in group.objects:
+                if obj.type == "NetworkGroup":
+                    members |= resolve(obj.id, seen)
+                else:
+                    members.add(values_by_id.get(obj.id, obj.name))
+
+            resolved[group_id] = members
+            return members
+
+        index: dict[str, list[str]] = {}
+        for group_id, group in netgroups.items():
+            for value in resolve(group_id, set()):
+                index.setdefault(value, []).append(group.name)
+
+        for groups in index.values():
+            groups.sort()
+
+        logger.debug(
+            f"Membership index built: {len(index)} values in {len(netgroups)} groups"
+        )
+        self.membership_index = index
+        return index
+
+    def get_groups_containing(self, ip_addrs: list[str]) -> dict[str, list[str]]:
+        """Looks up every network group that contains each IP, through a host object, a literal or a nested group"""
+        index = self.get_membership_index()
+        return {addr: index.get(addr, []) for addr in ip_addrs}
+
+    def forget_netgroups(self) -> None:
+        """Drops the cached network groups and membership index after a group has been changed"""
+        self.netgroups = None
+        self.membership_index = None
+
     def get_auth_header(self) -> dict[str, str]:
         """Checks the current time against the predicted expiry of the auth token.
-        Returns a dict with the correct formatted authentication header for a Requests API call against the FMC"""
+        Returns a dict with the correct formatted authentication header for a Requests API call against the FMC
+        """
         if self.token_expire < datetime.now():
             self.token_expire = datetime.now() + timedelta(minutes=30)
             return {
@@ -202,14 +440,15 @@ class AdderFMC:
         else:
             return {"X-auth-access-token": self.auth_token}
 
-    def get_creds(self) -> tuple[str, str]:
+    @staticmethod
+    def get_creds() -> tuple[str, str]:
         """Retrieve ADM username and password from the user"""
         username: str = input("ADM User: ")
         password: str = getpass(prompt="Password: ")
         creds: tuple[str, str] = (username, password)
         return creds
 
-    def get_deployable_devices(self) -> requests.Response:
+    def get_deployable_devices(self) -> list[DeployableDevice]:
         """Get a list of devices with config changes ready to be deployed from the FMC API"""
         payload: dict[str, bool | int] = {"expanded": True, "limit": 100}
         uri: str = f"{self.uri_base}/deployment/deployabledevices"
@@ -219,70 +458,133 @@ class AdderFMC:
             logger.error(f"Error retrieving list of deployable devices: {e}")
             raise
 
-        return r
+        return [
+            DeployableDevice.from_json(item)
+            for item in parse_response(r).get("items", [])
+        ]
+
+    def get_host_by_name(self, name: str) -> NetworkObject:
+        """Looks up a network address object by name in the inventory"""
+        try:
+            return self.get_all_hosts()[name]
+        except KeyError:
+            logger.error(f"Error retreiving info for specific host: {name}")
+            raise HostNotFoundWarning(name)
+
+    def get_host_by_uuid(self, uuid: str) -> NetworkObject:
+        uri = f"{self.uri_base}/object/hosts/{uuid}"
+        return NetworkObject.from_json(parse_response(self.get(uri)))
+
+    def get_netgrp_ips(self, network_group_object: NetworkGroup) -> list[str]:
+        """This helper function parses out the individual objects and literals from a network object group;
+        returns a string of obj names and literal IPs"""
+        return network_group_object.members()
+
+    def lookup_hosts(self, ip_addrs: list[str]) -> dict[str, list[NetworkObject]]:
+        """Finds the host objects holding each IP, by name or by value. If the inventory is already cached it is used,
+        otherwise each IP not looked up before costs one filtered query (nameOrValue), so checking a few addresses never
+        pulls the whole inventory. Returns a dict with the IPs as keys and the matching objects as values.
+        """
+        if self.hosts is not None:
+            found: dict[str, list[NetworkObject]] = {addr: [] for addr in ip_addrs}
+            for host in self.hosts.values():
+                for key in {host.name, host.value}:
+                    if key in found:
+                        found[key].append(host)
+            return found
 
-    def get_host_by_name(self, name: str) -> requests.Response:
         uri: str = f"{self.uri_base}/object/networkaddresses"
-        url: str | None = None
-        payload: dict[str, int] | None = {"limit": 1000}
-        r: requests.Response = self.get(uri, payload)
+        for addr in dict.fromkeys(ip_addrs):
+            if addr in self.host_lookups:
+                continue
 
-        while True:
-            try:
-                r: requests.Response = self.get(uri, payload, url)
-            except StatusCodeError as e:
-                logger.error(f"Error retreiving info for specific host: {name}")
-                raise
+            matches: list[NetworkObject] = []
+            url: str | None = None
+            payload: dict[str, Any] | None = {
+                "filter": f"nameOrValue:{addr}",
+                "limit": 1000,
+                "expanded": True,
+            }
+            while True:
+                try:
+                    r: requests.Response = self.get(uri, payload, url)
+                except StatusCodeError as e:
+                    logger.error(f"Error looking up network addresses for {addr}: {e}")
+                    raise
 
-            for item in r.json()["items"]:
-                if item["name"] == name:
-                    return self.get_host_by_uuid(item["id"])
-            else:
-                if "next" in r.json()["paging"].keys():
-                    url = r.json()["paging"]["next"][0]
+                page = parse_response(r)
+                # nameOrValue also matches partial names and values, so keep exact matches only
+                for item in page.get("items", []):
+                    host = NetworkObject.from_json(item)
+                    if addr in (host.name, host.value):
+                        matches.append(host)
+
+                if "next" in page["paging"].keys():
+                    url = page["paging"]["next"][0]
                     payload = None
                 else:
-                    raise HostNotFoundWarning(name)
+                    break
 
-    def get_host_by_uuid(self, uuid: str) -> requests.Response:
-        uri = f"{self.uri_base}/object/hosts/{uuid}"
-        return self.get(uri)
+            self.host_lookups[addr] = matches
 
-    def get_netgrp_ips(self, network_group_object: requests.Response) -> list[str]:
-        """This helper function parses out the individual objects and literals from the return of a GET on a network object group;
-        returns a string of obj names and literal IPs"""
-        ips_in_netgrp: list[str] = []
+        return {addr: self.host_lookups[addr] for addr in ip_addrs}
 
-        for each_object in network_group_object.json()["objects"]:
-            ips_in_netgrp.append(each_object["name"])
+    def has_renamed_hosts(self, network_group_object: NetworkGroup) -> bool:
+        """Adder names host objects after their IPs, so an IP can only hide in a group under another name if the group
+        holds host objects whose names aren't IPs. Returns True if it does."""
+        for obj in network_group_object.objects:
+            if obj.type != "Host":
+                continue
+            try:
+                ipaddress.ip_address(obj.name)
+            except ValueError:
+                return True
+        return False
 
-        for each_object in network_group_object.json()["literals"]:
-            ips_in_netgrp.append(each_object["value"])
+    def get_netgrp_values(
+        self, network_group_object: NetworkGroup, ip_addrs: list[str]
+    ) -> set[str]:
+        """Like get_netgrp_ips, but an IP held in the group through a host object with a different name is found too.
+        Returns a set of obj names and literal IPs, plus whichever of the IPs are held by value.
+        """
+        values = set(network_group_object.members())
+        unmatched = [addr for addr in ip_addrs if addr not in values]
+        if len(unmatched) == 0:
+            return values
+        if self.hosts is None and not self.has_renamed_hosts(network_group_object):
+            return values
 
-        return ips_in_netgrp
+        in_group = {obj.id for obj in network_group_object.objects}
+        for addr, hosts in self.lookup_hosts(unmatched).items():
+            if any(host.id in in_group for host in hosts):
+                values.add(addr)
+        return values
 
-    def get_netgroup_by_name(self, name: str) -> requests.Response | None:
-        """Searches for the network object group named in the args, returns the HTTP response if it's in the 200-299 range."""
-        uri: str = f"{self.uri_base}/object/networkgroups"
-        r: requests.Response = self.get(uri)
+    def get_host_ids_holding(
+        self, network_group_object: NetworkGroup, ip_addrs: list[str]
+    ) -> set[str]:
+        """Returns the UUIDs of the objects in the group that hold any of the IPs, by name or by value.
+        Values are only looked up when the inventory is cached or the group has renamed host objects.
+        """
+        wanted = set(ip_addrs)
+        holding = {obj.id for obj in network_group_object.objects if obj.name in wanted}
+        if self.hosts is None and not self.has_renamed_hosts(network_group_object):
+            return holding
 
-        found = False
-        while not found:
-            for item in r.json()["items"]:
-                if item["name"] == name:
-                    found = True
-                    logger.debug(f"Item with matching name found: {item['id']}")
-                    return self.get_netgroup_by_uuid(item["id"])
-            else:
-                if "next" in r.json()["paging"]:
-                    url = r.json()["paging"]["next"][0]
-                    logger.debug(f"URL for request built: {url}")
-                    r: requests.Response = self.get(uri, url=url)
-                else:
-                    return None
+        in_group = {obj.id for obj in network_group_object.objects}
+        for hosts in self.lookup_hosts(list(wanted)).values():
+            holding.update(host.id for host in hosts if host.id in in_group)
+        return holding
+
+    def get_netgroup_by_name(self, name: str) -> NetworkGroup | None:
+        """Searches for the network object group named in the args, returns the parsed group if it's found."""
+        try:
+            return self.get_netgroup_by_uuid(self.get_netgroup_uuid(name))
+        except ObjectNotFoundWarning:
+            return None
 
-    def get_netgroup_by_uuid(self, net_grp_id: str) -> requests.Response:
-        """FMC API GET request to grab the representation of an object group. Needs the UUID of the object group and returns the http response if it's in the 200 range."""
+    def get_netgroup_by_uuid(self, net_grp_id: str) -> NetworkGroup:
+        """FMC API GET request to grab the representation of an object group. Needs the UUID of the object group and returns the parsed group."""
         uri: str = f"{self.uri_base}/object/networkgroups/{net_grp_id}"
         try:
             r: requests.Response = self.get(uri)
@@ -290,46 +592,63 @@ class AdderFMC:
             logger.error(f"Error retreiving network group: {e}")
             raise
 
-        # if "next" not in r.json()["paging"].keys():
-        return r
-        # else:
-        #     raise SomethingBroke(
-        #         r.text,
-        #         message="Size of HTTP response is too big. Implement pagination.",
-        #     )
+        return NetworkGroup(parse_response(r))
 
     def get_netgroup_uuid(self, name: str) -> str:
         """Searches for the network object group named in the args, returns object's UUID if it's in the 200-299 range."""
         uri: str = f"{self.uri_base}/object/networkgroups"
         r: requests.Response = self.get(uri)
 
-        found = False
-        while not found:
-            for item in r.json()["items"]:
+        while True:
+            page = parse_response(r)
+            for item in page.get("items", []):
                 if item["name"] == name:
-                    found = True
                     logger.debug(f"UUID of object group {name}: {item['id']}")
                     return item["id"]
             else:
-                if "next" in r.json()["paging"]:
-                    url = r.json()["paging"]["next"][0]
+                if "next" in page["paging"]:
+                    url = page["paging"]["next"][0]
                     r: requests.Response = self.get(uri, url=url)
                 else:
                     break
         raise ObjectNotFoundWarning(name)
 
-    def get_tokens(self) -> dict[str, str]:
-        """API request to the FMC API to authenticate user and return the tokens necessary for further, authenticated, API calls."""
-        r: requests.Response = requests.post(
+    def get_tokens(self, domain: str | None = None) -> dict[str, str]:
+        """API request to the FMC API to authenticate user and return the tokens necessary for further, authenticated, API calls.
+        If a domain name is given, the UUID of that domain is returned instead of the user's default domain.
+        """
+        self.wait_for_rate_limit()
+        r: requests.Response = self.session.post(
             f"{self.host}/api/fmc_platform/v1/auth/generatetoken",
             auth=self._creds,
             verify=False,
         )
-        tokens: dict[str, str] = {
-            "auth": r.headers["X-auth-access-token"],
-            "refresh": r.headers["X-auth-refresh-token"],
-            "domain_uuid": r.headers["DOMAIN_UUID"],
-        }
+        if not 200 <= r.status_code <= 299:
+            raise StatusCodeError(r.status_code, r.text)
+
+        try:
+            tokens: dict[str, str] = {
+                "auth": r.headers["X-auth-access-token"],
+                "refresh": r.headers["X-auth-refresh-token"],
+                "domain_uuid": r.headers["DOMAIN_UUID"],
+            }
+        except KeyError as e:
+            raise SomethingBroke(
+                self.host, message=f"Login response is missing the {e} header"
+            )
+
+        if domain is not None:
+            for each_domain in json.loads(r.headers.get("DOMAINS", "[]")):
+                if each_domain["name"] == domain or each_domain["name"].endswith(
+                    f"/{domain}"
+                ):
+                    tokens["domain_uuid"] = each_domain["uuid"]
+                    break
+            else:
+                raise ObjectNotFoundWarning(
+                    domain, message=f"Domain not found on FMC {self.host}"
+                )
+
         return tokens
 
     def create_bulk_request_body(
@@ -349,11 +668,11 @@ class AdderFMC:
 
         return request_body
 
-    def create_host_objects(self, ip_addrs: list[str]) -> list[dict[str, str]]:
-        """Use the FMC API to create a new host object; returns the json representation of
-        the created objects."""
+    def create_host_objects(self, ip_addrs: list[str]) -> list[NetworkObject]:
+        """Use the FMC API to create a new host object; returns the parsed created objects,
+        which are also added to the cached inventory."""
         uri: str = f"{self.uri_base}/object/hosts"
-        new_objects: list[dict[str, str]] = []
+        new_objects: list[NetworkObject] = []
         flag = len(ip_addrs)
 
         try:
@@ -374,7 +693,10 @@ class AdderFMC:
             )
             payload: dict[str, bool] = {"bulk": True}
             logger.debug(
-                f"CREATE_NET_OBJ: URI: {uri}\n Body: {multi_body}\n Payload: {payload}"
+                "CREATE_NET_OBJ: URI: %s\n Body: %s\n Payload: %s",
+                uri,
+                BodySummary(multi_body),
+                payload,
             )
             try:
                 r: requests.Response = self.post(uri, multi_body, payload)
@@ -391,71 +713,293 @@ class AdderFMC:
             }
             try:
                 r: requests.Response = self.post(uri, single_body)
-                logger.debug(f"Create new object post response: {r.json()}")
+                logger.debug(
+                    "Create new object post response: %s", BodySummary(r.content)
+                )
             except StatusCodeError as e:
                 logger.error(f"Error creating host object: {e}")
                 raise
 
+        created = parse_response(r)
         if flag > 1:
-            for item in r.json()["items"]:
-                new_objects.append(
-                    {"name": item["name"], "id": item["id"], "type": item["type"]}
-                )
+            for item in created["items"]:
+                new_objects.append(NetworkObject.from_json(item))
         elif flag == 1:
-            new_objects.append(
-                {
-                    "name": r.json()["name"],
-                    "id": r.json()["id"],
-                    "type": r.json()["type"],
-                }
-            )
+            new_objects.append(NetworkObject.from_json(created))
 
-        logger.debug(f"New host objects created: {new_objects}")
+        for new_object in new_objects:
+            self.get_all_hosts()[new_object.name] = new_object
+
+        logger.debug("New host objects created: %s", BodySummary(new_objects))
         return new_objects
 
-    def update_group_from_existing_host(
-        self, group_uuid: str, host_name: str
-    ) -> requests.Response:
-        new_obj = []
-        existing_host = self.get_host_by_name(host_name).json()
-        existing_host.pop("links")
-        existing_host.pop("metadata")
-        existing_host.pop("value")
+    def update_group_from_existing_host(self, group_uuid: str, host_name: str) -> bool:
+        existing_host = self.get_host_by_name(host_name)
+        return self.update_object_group(group_uuid, [existing_host])
 
-        new_obj.append(existing_host)
-        return self.update_object_group(group_uuid, new_obj)
+    def edit_object_group(
+        self,
+        group_uuid: str,
+        edit: Callable[[NetworkGroup], bool],
+        verify: Callable[[NetworkGroup], bool],
+    ) -> bool:
+        """Read-modify-write of an object group. edit is handed a freshly read group, applies the intended change to it, and
+        returns False if there is nothing to change. Every PUT is preceded by a backup of the group. Returns True if the group was written.
+        By default that is one GET and one PUT. With verify_updates set, the update is also made safe to run while other adder
+        runs edit the same group: the group is read again right before the PUT, and read back after it and checked with verify.
+        If another run's PUT overwrote the change, the group is re-read and the change merged in again, up to
+        GROUP_UPDATE_ATTEMPTS times. That costs two more GETs and a wait of at least GROUP_VERIFY_DELAY per group.
+        """
+        uri = f"{self.uri_base}/object/networkgroups/{group_uuid}"
+        attempts = GROUP_UPDATE_ATTEMPTS if self.verify_updates else 1
+
+        for attempt in range(1, attempts + 1):
+            obj_group = self.get_netgroup_by_uuid(group_uuid)
+            version = obj_group.version()
+            # edit changes the group in place, so take the backup of it as it was read first
+            backup = obj_group.to_backup()
+            if not edit(obj_group):
+                # On a retry this means someone else's write already covers the change
+                return attempt > 1
+
+            # The FMC has no conditional PUT, so check the group right before writing it to keep the window for
+            # overwriting someone else's change down to the PUT itself
+            if (
+                self.verify_updates
+                and self.get_netgroup_by_uuid(group_uuid).version() != version
+            ):
+                logger.debug(
+                    f"Object group {group_uuid} changed while it was being edited (attempt {attempt}). Retrying."
+                )
+                time.sleep(random.uniform(0, min(8, 0.25 * 2**attempt)))
+                continue
+
+            self.backup_object_group(backup)
+            put_started = time.monotonic()
+            try:
+                self.put(uri, obj_group.to_body())
+            except StatusCodeError as e:
+                logger.error(f"Error writing data to object group: {e}")
+                raise
+
+            self.forget_netgroups()
+            if not self.verify_updates:
+                return True
+
+            # A run that checked the group just before our PUT landed can still overwrite it for about as long as
+            # a PUT takes, so give it twice as long as ours took before checking that the change stuck
+            time.sleep(max(GROUP_VERIFY_DELAY, 2 * (time.monotonic() - put_started)))
+            if verify(self.get_netgroup_by_uuid(group_uuid)):
+                return True
+
+            logger.warning(
+                f"Object group {group_uuid} was overwritten by someone else during the update (attempt {attempt}). Retrying."
+            )
+            time.sleep(random.uniform(0, min(8, 0.25 * 2**attempt)))
+
+        logger.error(f"Gave up on object group {group_uuid} after {attempts} attempts")
+        raise GroupUpdateConflictError(group_uuid)
 
     def update_object_group(
-        self, group_uuid: str, new_objects: list[dict[str, str]]
-    ) -> requests.Response:
+        self, group_uuid: str, new_objects: list[NetworkObject]
+    ) -> bool:
         """This function needs to take in a list of new objects to add into an object group,
         retrieve the existing object group, append the new data to it, and return it to the API via a PUT request.
-        We also grab a backup of the object-group being modified and dump it into a file for use by a rollback method."""
-        uri = f"{self.uri_base}/object/networkgroups/{group_uuid}"
+        We also grab a backup of the object-group being modified and dump it into a file for use by a rollback method.
+        Concurrent changes to the group are handled by edit_object_group. Returns True if the group was written.
+        """
+        new_ids = {obj.id for obj in new_objects}
 
-        obj_group = self.get_netgroup_by_uuid(group_uuid).json()
-        obj_group.update({"backup_timestamp": str(datetime.now())})
-        obj_group.update({"backup_uuid": str(uuid.uuid1())})
-        try:
-            with open(f"./backups/{obj_group['backup_timestamp']}.json", "w") as backup:
-                json.dump(obj_group, backup)
-        except:
-            logger.error(f"Error creating backup of {obj_group}")
-        obj_group.pop("metadata")
-        obj_group.pop("links")
-        obj_group.pop("backup_timestamp")
-        obj_group.pop("backup_uuid")
+        def edit(obj_group: NetworkGroup) -> bool:
+            in_group = {obj.id for obj in obj_group.objects}
+            added = False
+            for object in new_objects:
+                if object.id in in_group:
+                    logger.debug(
+                        f"{object.name} is already in object group {group_uuid}. Skipping."
+                    )
+                    continue
+                in_group.add(object.id)
+                obj_group.objects.append(object)
+                added = True
+            return added
 
-        for object in new_objects:
-            obj_group["objects"].append(object)
+        def verify(obj_group: NetworkGroup) -> bool:
+            return new_ids <= {obj.id for obj in obj_group.objects}
 
-        try:
-            r: requests.Response = self.put(uri, obj_group)
-        except StatusCodeError as e:
-            logger.error(f"Error writing data to object group: {e}")
-            raise
+        return self.edit_object_group(group_uuid, edit, verify)
 
-        return r
+    def update_group_literals(self, group_uuid: str, ip_addrs: list[str]) -> list[str]:
+        """Adds IP addresses straight into an object group as literals, skipping the creation of host objects entirely.
+        Addresses already in the group, either as a host object (by name or value) or a literal, are left out. Returns the list of literals that were added.
+        The object group is backed up before the PUT, and concurrent changes are handled, same as update_object_group.
+        """
+        new_literals: list[str] = []
+
+        def edit(obj_group: NetworkGroup) -> bool:
+            in_group = self.get_netgrp_values(obj_group, ip_addrs)
+            added = False
+            for addr in ip_addrs:
+                if addr in in_group:
+                    logger.debug(
+                        f"{addr} is already in object group {group_uuid}. Skipping."
+                    )
+                    continue
+                in_group.add(addr)
+                obj_group.literals.append({"type": "Host", "value": addr})
+                if addr not in new_literals:
+                    new_literals.append(addr)
+                added = True
+            return added
+
+        def verify(obj_group: NetworkGroup) -> bool:
+            return set(new_literals) <= self.get_netgrp_values(obj_group, new_literals)
+
+        if not self.edit_object_group(group_uuid, edit, verify):
+            logger.debug(f"No new literals to add to object group {group_uuid}")
+            return []
+
+        logger.debug(
+            "New literals added to object group %s: %s",
+            group_uuid,
+            BodySummary(new_literals),
+        )
+        return new_literals
+
+    def remove_from_object_group(
+        self, group_uuid: str, ip_addrs: list[str]
+    ) -> tuple[list[NetworkObject], list[str]]:
+        """Strips IP addresses out of an object group in a single PUT, whether they are in it as host objects or as literals.
+        Host objects are matched by name, and by value when the group holds host objects not named after their IPs, which costs
+        one filtered lookup per IP unless the inventory is already cached. The object group is backed up before the PUT, and
+        concurrent changes are handled, same as update_object_group. The FMC won't take a group with no members, so if the removal
+        would empty the group, EmptyObjectGroupError is raised before anything is written. Returns the objects and the literal IPs that were removed.
+        """
+        to_remove = set(ip_addrs)
+        removed_objects: dict[str, NetworkObject] = {}
+        removed_literals: list[str] = []
+
+        def edit(obj_group: NetworkGroup) -> bool:
+            host_ids = self.get_host_ids_holding(obj_group, ip_addrs)
+            removed = False
+            for obj in obj_group.objects:
+                if obj.id in host_ids:
+                    removed_objects[obj.id] = obj
+                    removed = True
+            for literal in obj_group.literals:
+                if literal["value"] in to_remove:
+                    if literal["value"] not in removed_literals:
+                        removed_literals.append(literal["value"])
+                    removed = True
+            obj_group.objects = [
+                obj for obj in obj_group.objects if obj.id not in host_ids
+            ]
+            obj_group.literals = [
+                literal
+                for literal in obj_group.literals
+                if literal["value"] not in to_remove
+            ]
+            if removed and len(obj_group.objects) == 0 and len(obj_group.literals) == 0:
+                raise EmptyObjectGroupError(obj_group.name)
+            return removed
+
+        def verify(obj_group: NetworkGroup) -> bool:
+            return len(self.get_host_ids_holding(obj_group, ip_addrs)) == 0 and not any(
+                literal["value"] in to_remove for literal in obj_group.literals
+            )
+
+        if not self.edit_object_group(group_uuid, edit, verify):
+            logger.debug(f"Nothing to remove from object group {group_uuid}")
+            return ([], [])
+
+        logger.debug(
+            "Removed from object group %s: objects %s, literals %s",
+            group_uuid,
+            BodySummary(list(removed_objects.values())),
+            BodySummary(removed_literals),
+        )
+        return (list(removed_objects.values()), removed_literals)
+
+    def get_unused_host_ids(self) -> set[str]:
+        """Returns the UUIDs of every host object on the FMC that isn't referenced by anything"""
+        unused: set[str] = set()
+        url: str | None = None
+        uri: str = f"{self.uri_base}/object/hosts"
+        payload: dict[str, Any] | None = {"filter": "unusedOnly:true", "limit": 1000}
+
+        while True:
+            try:
+                r: requests.Response = self.get(uri, payload, url)
+            except StatusCodeError as e:
+                logger.error(f"Error retrieving list of unused hosts: {e}")
+                raise
+
+            page = parse_response(r)
+            for item in page.get("items", []):
+                unused.add(item["id"])
+
+            if "next" in page["paging"].keys():
+                url = page["paging"]["next"][0]
+                payload = None
+            else:
+                break
+
+        return unused
+
+    def delete_host_objects(self, hosts: list[NetworkObject]) -> list[NetworkObject]:
+        """Deletes the given host objects with bulk DELETE requests, skipping any that are still referenced somewhere
+        on the FMC. Returns the host objects that were deleted, which are also dropped from the cached inventory and lookups.
+        """
+        uri: str = f"{self.uri_base}/object/hosts"
+        unused = self.get_unused_host_ids()
+        orphans: dict[str, NetworkObject] = {}
+        for host in hosts:
+            if host.type != "Host":
+                continue
+            if host.id not in unused:
+                logger.debug(f"Host {host.name} is still in use. Not deleting it.")
+                continue
+            orphans[host.id] = host
+
+        deleted: list[NetworkObject] = list(orphans.values())
+        for i in range(0, len(deleted), DELETE_BATCH_SIZE):
+            batch = deleted[i : i + DELETE_BATCH_SIZE]
+            payload = {
+                "bulk": True,
+                "filter": f"ids:{','.join(host.id for host in batch)}",
+            }
+            try:
+                self.delete(uri, payload)
+            except StatusCodeError as e:
+                logger.error(f"Error deleting host objects: {e}")
+                raise
+
+            if self.hosts is not None:
+                for host in batch:
+                    self.hosts.pop(host.name, None)
+
+        # Objects referenced from a group carry no value, so drop the deleted ones from the lookups by UUID
+        for addr, found in self.host_lookups.items():
+            self.host_lookups[addr] = [host for host in found if host.id not in orphans]
+
+        logger.debug("Orphaned host objects deleted: %s", BodySummary(deleted))
+        return deleted
+
+    def backup_object_group(self, obj_group: dict[str, Any]) -> None:
+        """Dumps the representation of an object group into a timestamped file in ./backups for use by a rollback method."""
+        backup_timestamp = str(datetime.now())
+        backup_body = dict(obj_group)
+        backup_body.update({"backup_timestamp": backup_timestamp})
+        backup_body.update({"backup_uuid": str(uuid.uuid1())})
+        try:
+            with open(f"./backups/{backup_timestamp}.json", "w") as backup:
+                json.dump(backup_body, backup)
+        except:
+            logger.error(
+                "Error creating backup of object group %s (%s)",
+                obj_group.get("name"),
+                obj_group.get("id"),
+            )
 
     def deploy_to_device(self, device_name: str):
         """API request to FMC. Takes in a device name as an argument and pushes the changes pending for that device."""
@@ -471,10 +1015,10 @@ class AdderFMC:
 
         found = False
         deployable_devices = self.get_deployable_devices()
-        for device in deployable_devices.json()["items"]:
-            if device["name"] == device_name:
-                body["version"] = device["version"]
-                body["deviceList"].append(device["device"]["id"])
+        for device in deployable_devices:
+            if device.name == device_name:
+                body["version"] = device.version
+                body["deviceList"].append(device.device_id)
                 found = True
                 break
 
@@ -491,16 +1035,14 @@ class AdderFMC:
             )
             raise
 
-        logger.debug(f"Deployment Response: {r.text}")
+        logger.debug("Deployment Response: %s", BodySummary(r.content))
         return r
 
     def check_host_exists(self, host: str) -> bool:
         """Match names of proposed object against the list of all net object names in the fmc"""
-        all_hosts = self.get_all_hosts()
-        for name in all_hosts:
-            if name == host:
-                logger.warning(
-                    f"The name of the host object {host} already exists on the FMC"
-                )
-                raise HostAlreadyExistsWarning(host)
-        return True
\ No newline at end of file
+        if host in self.get_all_hosts():
+            logger.warning(
+                f"The name of the host object {host} already exists on the FMC"
+            )
+            raise HostAlreadyExistsWarning(host)
+        return True
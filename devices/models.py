@@ -0,0 +1,129 @@
+from __future__ import annotations
+from typing import Any
+import requests
+
+# orjson is a lot faster at decoding large inventories, but adder works fine without it
+try:
+    import orjson
+
+    def loads(content: bytes | str) -> Any:
+        return orjson.loads(content)
+
+except ImportError:
+    import json
+
+    def loads(content: bytes | str) -> Any:
+        return json.loads(content)
+
+
+def parse_response(r: requests.Response) -> Any:
+    """Decodes the JSON body of an API response. Use this once per response and pass the result around."""
+    return loads(r.content)
+
+
+class NetworkObject:
+    """A host, network, range or nested group as it is referenced from the FMC inventory"""
+
+    __slots__ = ("id", "name", "type", "value")
+
+    def __init__(
+        self, id: str, name: str, type: str = "Host", value: str | None = None
+    ):
+        self.id = id
+        self.name = name
+        self.type = type
+        self.value = value
+
+    @classmethod
+    def from_json(cls, item: dict[str, Any]) -> NetworkObject:
+        return cls(
+            item["id"], item["name"], item.get("type", "Host"), item.get("value")
+        )
+
+    def reference(self) -> dict[str, str]:
+        """Returns the representation used to reference this object from inside a network group"""
+        return {"id": self.id, "name": self.name, "type": self.type}
+
+    def __repr__(self) -> str:
+        return f"NetworkObject({self.type} {self.name} {self.id})"
+
+
+class NetworkGroup:
+    """A network object group. Only the fields needed to write the group back with a PUT are kept, not the decoded body."""
+
+    __slots__ = (
+        "id",
+        "name",
+        "type",
+        "description",
+        "overridable",
+        "objects",
+        "literals",
+        "metadata",
+    )
+
+    def __init__(self, body: dict[str, Any]):
+        self.id: str = body["id"]
+        self.name: str = body["name"]
+        self.type: str = body.get("type", "NetworkGroup")
+        self.description: str | None = body.get("description")
+        self.overridable: bool | None = body.get("overridable")
+        self.objects: list[NetworkObject] = [
+            NetworkObject.from_json(item) for item in body.get("objects", [])
+        ]
+        self.literals: list[dict[str, str]] = list(body.get("literals", []))
+        self.metadata: dict[str, Any] = body.get("metadata", {})
+
+    def members(self) -> list[str]:
+        """Returns the names of the objects and the values of the literals in the group"""
+        return [obj.name for obj in self.objects] + [
+            literal["value"] for literal in self.literals
+        ]
+
+    def version(self) -> tuple[Any, frozenset[str]]:
+        """Identifies the state of the group, from the FMC's last-modified timestamp and the membership itself"""
+        return (
+            self.metadata.get("timestamp"),
+            frozenset(obj.id for obj in self.objects)
+            | frozenset(literal["value"] for literal in self.literals),
+        )
+
+    def to_body(self) -> dict[str, Any]:
+        """Builds the request body for a PUT of this group, from its current objects and literals"""
+        body: dict[str, Any] = {"id": self.id, "name": self.name, "type": self.type}
+        if self.description is not None:
+            body["description"] = self.description
+        if self.overridable is not None:
+            body["overridable"] = self.overridable
+        if len(self.objects) >= 1:
+            body["objects"] = [obj.reference() for obj in self.objects]
+        if len(self.literals) >= 1:
+            body["literals"] = list(self.literals)
+        return body
+
+    def to_backup(self) -> dict[str, Any]:
+        """Builds the backup representation of the group as it is right now: the PUT body plus the FMC metadata"""
+        backup = self.to_body()
+        backup["metadata"] = self.metadata
+        return backup
+
+    def __repr__(self) -> str:
+        return f"NetworkGroup({self.name} {self.id}: {len(self.objects)} objects, {len(self.literals)} literals)"
+
+
+class DeployableDevice:
+    """A device with config changes pending on the FMC"""
+
+    __slots__ = ("name", "device_id", "version")
+
+    def __init__(self, name: str, device_id: str, version: str):
+        self.name = name
+        self.device_id = device_id
+        self.version = version
+
+    @classmethod
+    def from_json(cls, item: dict[str, Any]) -> DeployableDevice:
+        return cls(item["name"], item["device"]["id"], item["version"])
+
+    def __repr__(self) -> str:
+        return f"DeployableDevice({self.name} {self.device_id} v{self.version})"
@@ -1,12 +1,15 @@
 from __future__ import annotations
 from utils import *
 from pynetbox.core.api import Api
-from pynetbox.models.ipam import Record
 from pynetbox.core.query import RequestError
 from configparser import ConfigParser
+from datetime import datetime, timezone
 from typing import Any
 from getpass import getpass
+import json
 import logging
+import os
+import re
 
 # Logging enable
 logger = logging.getLogger(__name__)
@@ -21,7 +24,25 @@ try:
 except:
     API_TOKEN = "None"
     logging.debug("API token not found in config. Will prompt.")
-NB_URL: str = config["netbox"]["url"]
+NB_URL: str = config.get("netbox", "url", fallback="None")
+
+SNAPSHOT_PATH: str = config.get(
+    "netbox", "snapshot", fallback="./cache/netbox_snapshot.json"
+)
+SNAPSHOT_MAX_AGE: int = config.getint("netbox", "snapshot_max_age", fallback=3600)
+
+# Number of site slugs sent in a single filtered prefix query
+SITE_BATCH_SIZE: int = 50
+DIA_INTERFACES: list[str] = ["dia1", "dia2"]
+WR_DEVICE_NAME = re.compile(r"^(?P<site>[a-z]{5})-wr-[12]$")
+
+
+def parse_timestamp(timestamp: str) -> datetime:
+    """Parses the ISO timestamps Netbox returns, which end in Z instead of an offset"""
+    parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
 
 
 class AdderNetbox(Api):
@@ -32,41 +53,273 @@ class AdderNetbox(Api):
             self.api_token = getpass(prompt="NetBox API token: ")
             Api.__init__(self, NB_URL, self.api_token)
         self.http_session.verify = False
+        self.prefix_cache: dict[
+            tuple[int | None, str | None], dict[str, str | None]
+        ] = {}
+        self.snapshot: dict[str, Any] = self.load_snapshot()
         logger.debug("Connection to Netbox established")
 
+    def load_snapshot(self) -> dict[str, Any]:
+        """Reads the local site->WR->DIA address snapshot from disk. Returns an empty snapshot if there isn't one."""
+        empty: dict[str, Any] = {"synced_at": None, "watermark": None, "sites": {}}
+        try:
+            with open(SNAPSHOT_PATH, "r") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            logger.debug(f"No Netbox snapshot at {SNAPSHOT_PATH}")
+            return empty
+        except (OSError, ValueError) as e:
+            logger.warning(
+                f"Netbox snapshot at {SNAPSHOT_PATH} is unreadable. Ignoring it: {e}"
+            )
+            return empty
+
+        logger.debug(
+            f"Netbox snapshot loaded: {len(snapshot['sites'])} sites, synced at {snapshot['synced_at']}"
+        )
+        return snapshot
+
+    def save_snapshot(self) -> None:
+        """Writes the snapshot to disk, through a temp file so a failed write never leaves a half-written snapshot behind"""
+        snapshot_dir = os.path.dirname(SNAPSHOT_PATH)
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+        try:
+            with open(f"{SNAPSHOT_PATH}.tmp", "w") as f:
+                json.dump(self.snapshot, f)
+            os.replace(f"{SNAPSHOT_PATH}.tmp", SNAPSHOT_PATH)
+        except OSError as e:
+            logger.error(f"Error writing Netbox snapshot to {SNAPSHOT_PATH}: {e}")
+
+    @staticmethod
+    def get_wr_assignment(ip_addr: Any) -> tuple[str, str, str] | None:
+        """Returns the site code, WR device name and interface name an IP address record is assigned to,
+        or None if it isn't assigned to an interface on a site WR"""
+        interface = getattr(ip_addr, "assigned_object", None)
+        device = getattr(interface, "device", None)
+        if interface is None or device is None:
+            return None
+        match = WR_DEVICE_NAME.match(str(device.name).lower())
+        if match is None:
+            return None
+        return (match.group("site"), device.name.lower(), interface.name)
+
+    @staticmethod
+    def get_latest_update(ip_addrs: list[Any], latest: str | None = None) -> str | None:
+        """Returns the newest last_updated timestamp out of the IP address records, or latest if none are newer"""
+        for ip_addr in ip_addrs:
+            last_updated = getattr(ip_addr, "last_updated", None)
+            if last_updated is not None and (
+                latest is None
+                or parse_timestamp(last_updated) > parse_timestamp(latest)
+            ):
+                latest = last_updated
+        return latest
+
+    def merge_dia_addresses(
+        self, sites: dict[str, dict[str, dict[str, str]]], ip_addrs: list[Any]
+    ) -> int:
+        """Merges the IP address records that are on a site WR's DIA interface into sites. Returns the number of addresses merged."""
+        merged = 0
+        for ip_addr in ip_addrs:
+            assignment = self.get_wr_assignment(ip_addr)
+            if assignment is None or assignment[2] not in DIA_INTERFACES:
+                continue
+
+            site_code, device, interface = assignment
+            sites.setdefault(site_code, {}).setdefault(device, {})[
+                interface
+            ] = ip_addr.address
+            merged += 1
+
+        return merged
+
+    def fetch_dia_addresses(
+        self, sites: dict[str, dict[str, dict[str, str]]], **filters: Any
+    ) -> int:
+        """Pulls DIA interface addresses from Netbox with the given filters and merges them into sites.
+        Raises RequestError if the lookup fails. Returns the number of addresses merged.
+        """
+        ip_addrs = list(
+            self.ipam.ip_addresses.filter(interface=DIA_INTERFACES, **filters)
+        )
+        return self.merge_dia_addresses(sites, ip_addrs)
+
+    def sync_snapshot(self, force: bool = False) -> None:
+        """Brings the local snapshot up to date. With force set, or with no snapshot yet, every DIA address is pulled in bulk.
+        Otherwise, once the snapshot is older than snapshot_max_age, the addresses changed in Netbox since the last sync are
+        pulled, and every site they are (or were) assigned to is dropped and pulled again in full. Deleted addresses leave no
+        trace to sync from, so they stay in the snapshot until --refresh-netbox or --refresh-site. If Netbox can't be reached,
+        the snapshot on disk is left as it was."""
+        synced_at = self.snapshot["synced_at"]
+        watermark = self.snapshot["watermark"]
+        now = datetime.now(timezone.utc)
+
+        try:
+            if force or synced_at is None or watermark is None:
+                logger.debug("Building Netbox snapshot from scratch")
+                sites: dict[str, dict[str, dict[str, str]]] = {}
+                ip_addrs = list(self.ipam.ip_addresses.filter(interface=DIA_INTERFACES))
+                merged = self.merge_dia_addresses(sites, ip_addrs)
+                watermark = self.get_latest_update(ip_addrs)
+            elif (now - parse_timestamp(synced_at)).total_seconds() > SNAPSHOT_MAX_AGE:
+                logger.debug(f"Refreshing Netbox snapshot since {watermark}")
+                # Not filtered by interface, so addresses moved off a DIA interface are caught too
+                changed = list(
+                    self.ipam.ip_addresses.filter(last_updated__gte=watermark)
+                )
+                changed_addrs = {str(ip_addr.address) for ip_addr in changed}
+                touched: list[str] = []
+                for ip_addr in changed:
+                    assignment = self.get_wr_assignment(ip_addr)
+                    if assignment is not None and assignment[0] not in touched:
+                        touched.append(assignment[0])
+
+                # Drop the touched sites, and any copy of a changed address left at the site it was reassigned away from
+                sites = {
+                    code: {
+                        device: {
+                            interface: address
+                            for interface, address in interfaces.items()
+                            if address not in changed_addrs
+                        }
+                        for device, interfaces in site.items()
+                    }
+                    for code, site in self.snapshot["sites"].items()
+                    if code not in touched
+                }
+                merged = 0
+                for i in range(0, len(touched), SITE_BATCH_SIZE):
+                    batch: list[str] = touched[i : i + SITE_BATCH_SIZE]
+                    devices: list[str] = [
+                        f"{code}-wr-{n}" for code in batch for n in (1, 2)
+                    ]
+                    merged += self.fetch_dia_addresses(sites, device=devices)
+                watermark = self.get_latest_update(changed, watermark)
+            else:
+                logger.debug(f"Netbox snapshot is fresh, synced at {synced_at}")
+                return
+        except RequestError as e:
+            logger.warning(
+                f"Netbox snapshot sync failed. Keeping the snapshot synced at {synced_at}: \n{e}"
+            )
+            return
+
+        self.snapshot = {
+            "synced_at": now.isoformat(),
+            "watermark": watermark,
+            "sites": sites,
+        }
+        self.save_snapshot()
+        logger.debug(f"Netbox snapshot synced: {merged} addresses merged")
+
+    def invalidate_sites(self, site_codes: list[str]) -> None:
+        """Drops sites from the snapshot, so their addresses are pulled live from Netbox on the next lookup"""
+        for site_code in site_codes:
+            self.snapshot["sites"].pop(site_code.lower(), None)
+        self.save_snapshot()
+        logger.debug(f"Sites dropped from the Netbox snapshot: {site_codes}")
+
+    def get_sites_dia_ip_addrs(self, site_codes: list[str]) -> dict[str, list[str]]:
+        """Looks up the DIA IP addresses of the WRs for many sites, without subnet masks. Sites are read from the local
+        snapshot, and any that aren't in it are pulled from Netbox in batches and added to it. Returns a dict with site
+        codes as keys and lists of IPs as values; sites with no DIA addresses in Netbox get an empty list.
+        """
+        requested: list[str] = list(dict.fromkeys(code.lower() for code in site_codes))
+        missing: list[str] = [
+            code for code in requested if code not in self.snapshot["sites"]
+        ]
+
+        if len(missing) >= 1:
+            logger.debug(
+                f"Sites not in the Netbox snapshot, looking up live: {missing}"
+            )
+            for i in range(0, len(missing), SITE_BATCH_SIZE):
+                batch: list[str] = missing[i : i + SITE_BATCH_SIZE]
+                devices: list[str] = [
+                    f"{code}-wr-{n}" for code in batch for n in (1, 2)
+                ]
+                try:
+                    self.fetch_dia_addresses(self.snapshot["sites"], device=devices)
+                except RequestError as e:
+                    logger.warning(
+                        f"DIA address lookup failed for sites {batch}: \n{e}"
+                    )
+            self.save_snapshot()
+
+        dia_ips: dict[str, list[str]] = {}
+        for code in requested:
+            site: dict[str, dict[str, str]] = self.snapshot["sites"].get(code, {})
+            dia_ips[code] = []
+            for device in (f"{code}-wr-1", f"{code}-wr-2"):
+                if device not in site:
+                    logger.warning(
+                        f"Address not found. It's possible the requested WR device {device} doesn't exist"
+                    )
+                    continue
+                for interface in DIA_INTERFACES:
+                    if interface in site[device]:
+                        dia_ips[code].append(site[device][interface].split("/")[0])
+                    else:
+                        logger.warning(
+                            f"Address not found. It's possible the DIA interface {interface} on {device} doesn't exist"
+                        )
+
+        logger.debug("DIA IPs: %s", BodySummary(dia_ips))
+        return dia_ips
+
     def get_dia_ip_addrs(self, site_code: str) -> list[str]:
-        """Use Netbox API to grab all DIA IP addresses from site wanrouters.
+        """Use Netbox (or the local snapshot of it) to grab all DIA IP addresses from site wanrouters.
         Also parse and remove subnet masks. Returns a list."""
+        return self.get_sites_dia_ip_addrs([site_code])[site_code.lower()]
 
-        devices: list = [f"{site_code}-wr-1", f"{site_code}-wr-2"]
-        dia_ips_masked: list = []
+    def get_site_prefixes(
+        self, site_codes: list[str], vlan_vid: int | None = 3, role: str | None = None
+    ) -> dict[str, str]:
+        """Use Netbox API to grab the prefix assigned to a VLAN ID and/or prefix role for many sites at once.
+        Sites are queried in batches with the vlan/role filters applied server side, and the results are cached
+        for the rest of the run. Returns a dict with site codes as keys and prefixes as values; sites with no
+        matching prefix are left out. A batch that fails to query is not cached, so it is retried on the next call.
+        """
+        cache: dict[str, str | None] = self.prefix_cache.setdefault(
+            (vlan_vid, role), {}
+        )
+        requested: list[str] = list(dict.fromkeys(code.lower() for code in site_codes))
+        missing: list[str] = [code for code in requested if code not in cache]
+
+        for i in range(0, len(missing), SITE_BATCH_SIZE):
+            batch: list[str] = missing[i : i + SITE_BATCH_SIZE]
+            filters: dict[str, Any] = {"site": batch}
+            if vlan_vid is not None:
+                filters["vlan_vid"] = vlan_vid
+            if role is not None:
+                filters["role"] = role
 
-        for device in devices:
             try:
-                dia_ips_masked.append(self.ipam.ip_addresses.get(device=device, interface="dia1").address)  # type: ignore
-                dia_ips_masked.append(self.ipam.ip_addresses.get(device=device, interface="dia2").address)  # type: ignore
-            except AttributeError as e:
-                logger.warning(
-                    f"Address not found. It's possible one of the requested WR devices doesn't exist: \n{e} "
-                )
-                continue
+                prefixes = list(self.ipam.prefixes.filter(**filters))
             except RequestError as e:
-                logger.warning(
-                    f"Address not found. It's possible one of the requested DIA interfaces doesn't exist: \n{e}"
-                )
+                logger.warning(f"Prefix lookup failed for sites {batch}: \n{e}")
                 continue
-        dia_ips: list = [x[0:-3] for x in dia_ips_masked]
-        logger.debug(f"DIA IPs: {dia_ips}")
-        return dia_ips
 
-    def get_vlan_3(self, site_code: str) -> str | None:
-        """Use Netbox API to grab the subnet value of vlan 3 at a site"""
+            for prefix in prefixes:
+                site = getattr(prefix, "site", None)
+                if site is None:
+                    continue
+                if cache.get(site.slug) is not None:
+                    logger.debug(
+                        f"Site {site.slug} has more than one matching prefix. Keeping {cache[site.slug]}, ignoring {prefix.prefix}"
+                    )
+                    continue
+                cache[site.slug] = str(prefix.prefix)
 
-        site_prefixes: list[Any | Record] | Any | Record = self.ipam.prefixes.filter(
-            site=f"{site_code}"
-        )
+            for code in batch:
+                if cache.setdefault(code, None) is None:
+                    logger.warning(
+                        f"No prefix found for site {code} with vlan {vlan_vid} and role {role}"
+                    )
 
-        if f"{site_code}" in site_prefixes[3].description.lower() and "vlan3" in site_prefixes[3].description.lower():  # type: ignore
-            return str(site_prefixes[3].prefix)  # type: ignore
-        else:
-            return None
\ No newline at end of file
+        return {code: cache.get(code) for code in requested if cache.get(code) is not None}  # type: ignore
+
+    def get_vlan_3(self, site_code: str) -> str | None:
+        """Use Netbox API to grab the subnet value of vlan 3 at a site"""
+        return self.get_site_prefixes([site_code]).get(site_code.lower())
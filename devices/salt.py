@@ -0,0 +1,171 @@
+from __future__ import annotations
+from utils import *
+from configparser import ConfigParser
+from concurrent.futures import ThreadPoolExecutor
+from getpass import getpass
+from typing import Any
+from urllib.parse import urlparse
+import ipaddress
+import logging
+import requests
+import urllib3
+
+# Ignore SSL warnings from the Salt API
+urllib3.disable_warnings()
+
+# Logging enable
+logger = logging.getLogger(__name__)
+
+# Read in configuration data from config.ini
+config = ConfigParser()
+config.read("adder.conf")
+
+# Set global variables from the config file
+SALT_MASTERS: list[str] = [
+    master.strip().rstrip("/")
+    for master in config.get("salt", "masters", fallback="").split(",")
+    if master.strip()
+]
+SALT_USER: str = config.get("salt", "username", fallback="None")
+SALT_PASS: str = config.get("salt", "password", fallback="None")
+SALT_EAUTH: str = config.get("salt", "eauth", fallback="pam")
+SALT_TARGET: str = config.get("salt", "target", fallback="None")
+SALT_STATE: str = config.get("salt", "state", fallback="adder.dia_allowlist")
+SALT_PILLAR_KEY: str = config.get("salt", "pillar_key", fallback="adder_dia_allowlist")
+SALT_MAX_WORKERS: int = config.getint("salt", "max_workers", fallback=8)
+SALT_TIMEOUT: int = config.getint("salt", "timeout", fallback=120)
+SALT_EXCEPTIONS = (requests.RequestException, ValueError, KeyError, IndexError)
+
+
+class AdderSalt:
+    """Pushes the DIA IP allow-list to the Salt masters' firewalls through the Salt REST API (rest_cherrypy)"""
+
+    name: str = "Salt"
+
+    def __init__(
+        self,
+        masters: list[str] | None = None,
+        target: str = SALT_TARGET,
+        state: str = SALT_STATE,
+        pillar_key: str = SALT_PILLAR_KEY,
+        max_workers: int = SALT_MAX_WORKERS,
+    ):
+        self.masters: list[str] = masters if masters is not None else SALT_MASTERS
+        self.target: str = target
+        self.state: str = state
+        self.pillar_key: str = pillar_key
+        self.max_workers: int = max_workers
+        self._creds: tuple[str, str] = self.get_creds()
+        logger.debug(f"Salt masters loaded: {self.masters}")
+
+    def get_creds(self) -> tuple[str, str]:
+        """Retrieve the Salt API username and password from the config, or from the user if they aren't there"""
+        username: str = SALT_USER if SALT_USER != "None" else input("Salt User: ")
+        password: str = (
+            SALT_PASS if SALT_PASS != "None" else getpass(prompt="Salt Password: ")
+        )
+        return (username, password)
+
+    def build_pillar(self, ip_addrs: list[str]) -> dict[str, Any]:
+        """Renders the allow-list as pillar data for the firewall state, with the addresses split by family"""
+        ipv4: list[str] = []
+        ipv6: list[str] = []
+        for addr in sorted(set(ip_addrs)):
+            if ipaddress.ip_address(addr).version == 4:
+                ipv4.append(addr)
+            else:
+                ipv6.append(addr)
+
+        return {self.pillar_key: {"ipv4": ipv4, "ipv6": ipv6}}
+
+    def get_target(self, master: str) -> str:
+        """The minion to apply the state to on a master. Defaults to the master's own hostname."""
+        if self.target != "None":
+            return self.target
+        return str(urlparse(master).hostname)
+
+    def login(self, session: requests.Session, master: str) -> str:
+        """Authenticates against a Salt master's REST API and returns the session token"""
+        r: requests.Response = session.post(
+            f"{master}/login",
+            json={
+                "username": self._creds[0],
+                "password": self._creds[1],
+                "eauth": SALT_EAUTH,
+            },
+            timeout=SALT_TIMEOUT,
+        )
+        if not 200 <= r.status_code <= 299:
+            raise StatusCodeError(r.status_code, r.text)
+        return r.json()["return"][0]["token"]
+
+    def push_to_master(self, master: str, pillar: dict[str, Any]) -> str:
+        """Applies the allow-list state on a single master, with every change in one API call. Returns a short status string."""
+        lowstate: list[dict[str, Any]] = [
+            {
+                "client": "local",
+                "tgt": self.get_target(master),
+                "fun": "state.apply",
+                "arg": [self.state],
+                "kwarg": {"pillar": pillar},
+            }
+        ]
+
+        with requests.Session() as session:
+            session.verify = False
+            try:
+                token = self.login(session, master)
+                r: requests.Response = session.post(
+                    master,
+                    json=lowstate,
+                    headers={"X-Auth-Token": token, "Accept": "application/json"},
+                    timeout=SALT_TIMEOUT,
+                )
+                if not 200 <= r.status_code <= 299:
+                    raise StatusCodeError(r.status_code, r.text)
+                minions: dict[str, Any] = r.json()["return"][0]
+            except (StatusCodeError, *SALT_EXCEPTIONS) as e:
+                logger.error(f"Error pushing allow-list to Salt master {master}: {e}")
+                return f"failed: {e}"
+
+        if len(minions) == 0:
+            logger.error(f"No minions on {master} matched {self.get_target(master)}")
+            return "failed: no minions matched"
+
+        failed: list[str] = []
+        for minion, states in minions.items():
+            if not isinstance(states, dict) or not all(
+                state.get("result") is not False for state in states.values()
+            ):
+                failed.append(minion)
+
+        if len(failed) >= 1:
+            logger.error(f"Allow-list state failed on {master} for minions {failed}")
+            return f"failed on {failed}"
+
+        logger.debug(f"Allow-list state applied on {master}")
+        return "applied"
+
+    def push(self, ip_addrs: list[str]) -> dict[str, str]:
+        """Pushes the IP addresses to every configured Salt master concurrently, with at most max_workers
+        masters being updated at once. Returns a dict with master URLs as keys and push status as values.
+        """
+        if len(ip_addrs) == 0 or len(self.masters) == 0:
+            logger.debug("Nothing to push to the Salt masters")
+            return {}
+
+        pillar: dict[str, Any] = self.build_pillar(ip_addrs)
+        logger.debug(
+            f"Pushing {len(ip_addrs)} addresses to {len(self.masters)} Salt masters"
+        )
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            statuses = executor.map(
+                lambda master: self.push_to_master(master, pillar), self.masters
+            )
+            results: dict[str, str] = dict(zip(self.masters, statuses))
+
+        logger.debug(f"Salt push results: {results}")
+        return results
+
+    def close(self) -> None:
+        pass
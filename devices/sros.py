@@ -1,9 +1,185 @@
+from __future__ import annotations
+from utils import *
 from configparser import ConfigParser
+from concurrent.futures import ThreadPoolExecutor
+from getpass import getpass
+from threading import Lock
+from xml.sax.saxutils import escape
+from ncclient import manager
+from ncclient.manager import Manager
+from ncclient.operations import RPCError
+from ncclient.transport.errors import TransportError
+import ipaddress
+import logging
+
+# Logging enable
+logger = logging.getLogger(__name__)
 
 # Read in configuration data from config.ini
 config = ConfigParser()
 config.read("adder.conf")
 
 # Set global variables from the config file
-# SROS_PASS: str = config["sros"]["password"]
-# SROS_USER: str = config["sros"]["username"]
\ No newline at end of file
+SROS_ROUTERS: list[str] = [
+    router.strip()
+    for router in config.get("sros", "routers", fallback="").split(",")
+    if router.strip()
+]
+SROS_PORT: int = config.getint("sros", "port", fallback=830)
+SROS_PREFIX_LIST: str = config.get("sros", "prefix_list", fallback="Store-DIA-PROD")
+SROS_MAX_WORKERS: int = config.getint("sros", "max_workers", fallback=8)
+SROS_USER: str = config.get("sros", "username", fallback="None")
+SROS_PASS: str = config.get("sros", "password", fallback="None")
+SROS_CONF_NS: str = "urn:nokia.com:sros:ns:yang:sr:conf"
+NETCONF_EXCEPTIONS = (RPCError, TransportError, OSError)
+
+
+class SROSConnectionPool:
+    """Keeps one NETCONF session open per router for the length of the run, so repeated pushes to the same
+    router don't pay for a new SSH handshake every time."""
+
+    def __init__(self, username: str, password: str, port: int = SROS_PORT):
+        self.username: str = username
+        self.password: str = password
+        self.port: int = port
+        self.sessions: dict[str, Manager] = {}
+        self.locks: dict[str, Lock] = {}
+        self._pool_lock: Lock = Lock()
+
+    def lock_for(self, host: str) -> Lock:
+        """Returns the lock serializing work on a single router's session"""
+        with self._pool_lock:
+            return self.locks.setdefault(host, Lock())
+
+    def get(self, host: str) -> Manager:
+        """Returns an open NETCONF session to the router, connecting (or reconnecting) if needed.
+        Callers should hold lock_for(host) while using the session."""
+        session = self.sessions.get(host)
+        if session is not None and session.connected:
+            return session
+
+        logger.debug(f"Opening NETCONF session to {host}:{self.port}")
+        session = manager.connect(
+            host=host,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            hostkey_verify=False,
+            allow_agent=False,
+            look_for_keys=False,
+            device_params={"name": "sros"},
+        )
+        self.sessions[host] = session
+        return session
+
+    def close_all(self) -> None:
+        """Closes every session in the pool"""
+        with self._pool_lock:
+            for host, session in self.sessions.items():
+                try:
+                    if session.connected:
+                        session.close_session()
+                except NETCONF_EXCEPTIONS as e:
+                    logger.warning(f"Error closing NETCONF session to {host}: {e}")
+            self.sessions.clear()
+
+
+class AdderSROS:
+    """Pushes DIA IP addresses into a prefix-list on the SROS routers over NETCONF"""
+
+    name: str = "SROS"
+
+    def __init__(
+        self,
+        routers: list[str] | None = None,
+        prefix_list: str = SROS_PREFIX_LIST,
+        max_workers: int = SROS_MAX_WORKERS,
+    ):
+        self.routers: list[str] = routers if routers is not None else SROS_ROUTERS
+        self.prefix_list: str = prefix_list
+        self.max_workers: int = max_workers
+        self.pool: SROSConnectionPool = SROSConnectionPool(*self.get_creds())
+        logger.debug(f"SROS routers loaded: {self.routers}")
+
+    def get_creds(self) -> tuple[str, str]:
+        """Retrieve the SROS username and password from the config, or from the user if they aren't there"""
+        username: str = SROS_USER if SROS_USER != "None" else input("SROS User: ")
+        password: str = (
+            SROS_PASS if SROS_PASS != "None" else getpass(prompt="SROS Password: ")
+        )
+        return (username, password)
+
+    def build_prefix_list_config(self, ip_addrs: list[str]) -> str:
+        """Renders the <config> payload adding every IP address to the prefix-list as a host prefix.
+        IPv4 and IPv6 addresses land in the ip-prefix-list and ipv6-prefix-list of the same name.
+        """
+        name: str = escape(self.prefix_list)
+        v4_prefixes: list[str] = []
+        v6_prefixes: list[str] = []
+
+        for addr in ip_addrs:
+            ip = ipaddress.ip_address(addr)
+            if ip.version == 4:
+                v4_prefixes.append(f"<prefix><ip-prefix>{ip}/32</ip-prefix></prefix>")
+            else:
+                v6_prefixes.append(
+                    f"<prefix><ipv6-prefix>{ip}/128</ipv6-prefix></prefix>"
+                )
+
+        match_lists: str = ""
+        if len(v4_prefixes) >= 1:
+            match_lists += f"<ip-prefix-list><prefix-list-name>{name}</prefix-list-name>{''.join(v4_prefixes)}</ip-prefix-list>"
+        if len(v6_prefixes) >= 1:
+            match_lists += f"<ipv6-prefix-list><prefix-list-name>{name}</prefix-list-name>{''.join(v6_prefixes)}</ipv6-prefix-list>"
+
+        return f'<config><configure xmlns="{SROS_CONF_NS}"><filter><match-list>{match_lists}</match-list></filter></configure></config>'
+
+    def push_to_router(self, host: str, config_body: str) -> str:
+        """Applies the rendered config to a single router's candidate datastore and commits it in one go.
+        Pending candidate changes are discarded if anything fails. Returns a short status string.
+        """
+        with self.pool.lock_for(host):
+            try:
+                session = self.pool.get(host)
+            except NETCONF_EXCEPTIONS as e:
+                logger.error(f"Failed to connect to SROS router {host}: {e}")
+                return f"connection failed: {e}"
+
+            try:
+                with session.locked(target="candidate"):
+                    try:
+                        session.edit_config(target="candidate", config=config_body)
+                        session.commit()
+                    except NETCONF_EXCEPTIONS:
+                        session.discard_changes()
+                        raise
+            except NETCONF_EXCEPTIONS as e:
+                logger.error(f"Error pushing prefix-list to SROS router {host}: {e}")
+                return f"failed: {e}"
+
+        logger.debug(f"Prefix-list {self.prefix_list} committed on {host}")
+        return "committed"
+
+    def push(self, ip_addrs: list[str]) -> dict[str, str]:
+        """Pushes the IP addresses to every configured router concurrently, with at most max_workers
+        routers being updated at once. Returns a dict with router names as keys and push status as values.
+        """
+        if len(ip_addrs) == 0 or len(self.routers) == 0:
+            logger.debug("Nothing to push to the SROS routers")
+            return {}
+
+        config_body: str = self.build_prefix_list_config(ip_addrs)
+        logger.debug(
+            f"Pushing {len(ip_addrs)} addresses to {len(self.routers)} SROS routers"
+        )
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            statuses = executor.map(
+                lambda host: self.push_to_router(host, config_body), self.routers
+            )
+            results: dict[str, str] = dict(zip(self.routers, statuses))
+
+        logger.debug(f"SROS push results: {results}")
+        return results
+
+    def close(self) -> None:
+        self.pool.close_all()
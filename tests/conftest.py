@@ -0,0 +1,5 @@
+import os
+import sys
+
+# adder isn't an installed package, so make the modules at the top of the repo importable from the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
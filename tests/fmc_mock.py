@@ -0,0 +1,248 @@
+"""A small in-memory stand-in for the FMC REST API, covering just enough of it to drive AdderFMC's group updates:
+logging in, creating host objects, listing the host inventory, and reading and writing network groups.
+Every PUT to a group bumps its metadata timestamp, the way the FMC does, and can be slowed down to widen the
+window for concurrent writers to overwrite each other."""
+
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+import json
+import random
+import re
+import time
+import uuid
+
+
+class MockFMCState:
+    """Everything the mock FMC knows about. One network group, grp-1, exists from the start."""
+
+    def __init__(self, put_delay: float = 0.0):
+        self.lock: Lock = Lock()
+        self.hosts: dict[str, dict[str, str]] = {}
+        self.groups: dict[str, dict[str, Any]] = {
+            "grp-1": {
+                "id": "grp-1",
+                "name": "Store-DIA-PROD",
+                "type": "NetworkGroup",
+                "description": "DIA addresses",
+                "overridable": False,
+                "objects": [],
+                "literals": [],
+                "timestamp": 0,
+            }
+        }
+        self.timestamp: int = 0
+        self.put_delay: float = put_delay
+        self.requests: dict[str, int] = {}
+
+    def count(self, method: str) -> None:
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+    def add_host(self, name: str, value: str, group_id: str | None = None) -> str:
+        """Creates a host object, optionally putting it straight into a group. Returns its UUID."""
+        host_id = str(uuid.uuid4())
+        with self.lock:
+            self.hosts[host_id] = {
+                "id": host_id,
+                "name": name,
+                "value": value,
+                "type": "Host",
+            }
+            if group_id is not None:
+                self.groups[group_id]["objects"].append(
+                    {"id": host_id, "name": name, "type": "Host"}
+                )
+        return host_id
+
+    def group_members(self, group_id: str) -> set[str]:
+        """Returns the values of every host object and literal in a group"""
+        group = self.groups[group_id]
+        return {
+            self.hosts[obj["id"]]["value"]
+            for obj in group["objects"]
+            if obj["id"] in self.hosts
+        } | {literal["value"] for literal in group["literals"]}
+
+
+def make_handler(state: MockFMCState) -> type[BaseHTTPRequestHandler]:
+    class MockFMCHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def send_json(
+            self, code: int, body: Any, headers: dict[str, str] | None = None
+        ) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def read_json(self) -> Any:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length)) if length else None
+
+        def render_group(self, group: dict[str, Any]) -> dict[str, Any]:
+            # Like the FMC, leave out objects/literals entirely when the group has none
+            body: dict[str, Any] = {
+                "id": group["id"],
+                "name": group["name"],
+                "type": group["type"],
+                "description": group["description"],
+                "overridable": group["overridable"],
+                "metadata": {"timestamp": group["timestamp"]},
+                "links": {"self": self.path},
+            }
+            if len(group["objects"]) >= 1:
+                body["objects"] = group["objects"]
+            if len(group["literals"]) >= 1:
+                body["literals"] = group["literals"]
+            return body
+
+        def do_POST(self) -> None:
+            state.count("POST")
+            path = urlparse(self.path).path
+            if path.endswith("/auth/generatetoken"):
+                self.send_json(
+                    204,
+                    {},
+                    {
+                        "X-auth-access-token": "access",
+                        "X-auth-refresh-token": "refresh",
+                        "DOMAIN_UUID": "domain",
+                    },
+                )
+            elif path.endswith("/object/hosts"):
+                body = self.read_json()
+                created = []
+                with state.lock:
+                    for item in body if isinstance(body, list) else [body]:
+                        host = {
+                            "id": str(uuid.uuid4()),
+                            "name": item["name"],
+                            "value": item["value"],
+                            "type": "Host",
+                        }
+                        state.hosts[host["id"]] = host
+                        created.append(host)
+                self.send_json(
+                    201, {"items": created} if isinstance(body, list) else created[0]
+                )
+            else:
+                self.send_json(404, {"error": path})
+
+        def do_GET(self) -> None:
+            state.count("GET")
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            match = re.search(r"/object/networkgroups/([^/]+)$", url.path)
+            if match is not None:
+                with state.lock:
+                    group = state.groups.get(match.group(1))
+                    body = self.render_group(group) if group is not None else None
+                if body is None:
+                    self.send_json(404, {})
+                else:
+                    self.send_json(200, body)
+            elif url.path.endswith("/object/networkgroups"):
+                with state.lock:
+                    items = [
+                        {
+                            "id": group["id"],
+                            "name": group["name"],
+                            "type": group["type"],
+                        }
+                        for group in state.groups.values()
+                    ]
+                self.send_json(200, {"items": items, "paging": {"count": len(items)}})
+            elif url.path.endswith("/object/networkaddresses"):
+                offset = int(query.get("offset", ["0"])[0])
+                limit = int(query.get("limit", ["25"])[0])
+                with state.lock:
+                    hosts = list(state.hosts.values())
+                for query_filter in query.get("filter", []):
+                    if query_filter.startswith("nameOrValue:"):
+                        term = query_filter[len("nameOrValue:") :]
+                        hosts = [
+                            host
+                            for host in hosts
+                            if term in host["name"] or term in host["value"]
+                        ]
+                paging: dict[str, Any] = {"count": len(hosts)}
+                if offset + limit < len(hosts):
+                    paging["next"] = [
+                        f"http://{self.headers['Host']}{url.path}?offset={offset + limit}&limit={limit}"
+                    ]
+                self.send_json(
+                    200, {"items": hosts[offset : offset + limit], "paging": paging}
+                )
+            else:
+                self.send_json(404, {"error": url.path})
+
+        def do_PUT(self) -> None:
+            state.count("PUT")
+            match = re.search(
+                r"/object/networkgroups/([^/]+)$", urlparse(self.path).path
+            )
+            body = self.read_json()
+            if match is None or match.group(1) not in state.groups:
+                self.send_json(404, {})
+                return
+            if "objects" not in body and "literals" not in body:
+                self.send_json(400, {"error": "Network group must have members"})
+                return
+
+            # The delay lands between reading the request and storing it, so other writers can get in first
+            if state.put_delay:
+                time.sleep(random.random() * state.put_delay)
+            with state.lock:
+                state.timestamp += 1
+                group = {
+                    "id": match.group(1),
+                    "name": body["name"],
+                    "type": "NetworkGroup",
+                    "description": body.get("description"),
+                    "overridable": body.get("overridable", False),
+                    "objects": [
+                        {"id": obj["id"], "name": obj["name"], "type": obj["type"]}
+                        for obj in body.get("objects", [])
+                    ],
+                    "literals": list(body.get("literals", [])),
+                    "timestamp": state.timestamp,
+                }
+                state.groups[match.group(1)] = group
+                rendered = self.render_group(group)
+            self.send_json(200, rendered)
+
+    return MockFMCHandler
+
+
+class MockFMCServer(ThreadingHTTPServer):
+    # Dozens of adders connect at once, more than the default listen backlog of 5
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class MockFMC:
+    """Runs the mock FMC on a random local port in a background thread. Use it as a context manager."""
+
+    def __init__(self, put_delay: float = 0.0):
+        self.state: MockFMCState = MockFMCState(put_delay)
+        self.server: MockFMCServer = MockFMCServer(
+            ("127.0.0.1", 0), make_handler(self.state)
+        )
+        self.url: str = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self) -> MockFMC:
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.server.shutdown()
+        self.server.server_close()
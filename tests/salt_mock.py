@@ -0,0 +1,111 @@
+"""A small in-memory stand-in for the Salt REST API (rest_cherrypy), covering just enough of it to drive AdderSalt:
+logging in and running a lowstate chunk. Every master is served from the same port under its own path, e.g.
+http://127.0.0.1:<port>/master1, and can be told to match no minions or to fail the state.
+"""
+
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Any
+import json
+
+APPLIED: str = "applied"
+NO_MINIONS: str = "no minions"
+STATE_FAILED: str = "state failed"
+
+
+class MockSaltState:
+    """Everything the mock Salt masters know about: how each master answers, and every request it received"""
+
+    def __init__(self, outcomes: dict[str, str]):
+        self.lock: Lock = Lock()
+        self.outcomes: dict[str, str] = outcomes
+        self.requests: dict[str, list[tuple[str, Any]]] = {
+            master: [] for master in outcomes
+        }
+
+    def record(self, master: str, path: str, body: Any) -> None:
+        with self.lock:
+            self.requests[master].append((path, body))
+
+
+def make_handler(state: MockSaltState) -> type[BaseHTTPRequestHandler]:
+    class MockSaltHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def send_json(self, code: int, body: Any) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def read_json(self) -> Any:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length)) if length else None
+
+        def do_POST(self) -> None:
+            master, _, path = self.path.strip("/").partition("/")
+            if master not in state.outcomes:
+                self.send_json(404, {"error": self.path})
+                return
+            body = self.read_json()
+            state.record(master, path, body)
+
+            if path == "login":
+                self.send_json(
+                    200, {"return": [{"token": f"token-{master}", "eauth": "pam"}]}
+                )
+            elif path == "":
+                if self.headers.get("X-Auth-Token") != f"token-{master}":
+                    self.send_json(401, {"error": "Unauthorized"})
+                    return
+                outcome = state.outcomes[master]
+                if outcome == NO_MINIONS:
+                    self.send_json(200, {"return": [{}]})
+                    return
+                result = outcome != STATE_FAILED
+                self.send_json(
+                    200,
+                    {
+                        "return": [
+                            {
+                                body[0]["tgt"]: {
+                                    "iptables_|-dia_allowlist_|-dia_allowlist_|-append": {
+                                        "result": result,
+                                        "comment": "applied" if result else "failed",
+                                    }
+                                }
+                            }
+                        ]
+                    },
+                )
+            else:
+                self.send_json(404, {"error": self.path})
+
+    return MockSaltHandler
+
+
+class MockSalt:
+    """Runs the mock Salt masters on a random local port in a background thread. Use it as a context manager."""
+
+    def __init__(self, outcomes: dict[str, str]):
+        self.state: MockSaltState = MockSaltState(outcomes)
+        self.server: ThreadingHTTPServer = ThreadingHTTPServer(
+            ("127.0.0.1", 0), make_handler(self.state)
+        )
+        self.server.daemon_threads = True
+        self.url: str = f"http://127.0.0.1:{self.server.server_port}"
+
+    def master_url(self, master: str) -> str:
+        return f"{self.url}/{master}"
+
+    def __enter__(self) -> MockSalt:
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.server.shutdown()
+        self.server.server_close()
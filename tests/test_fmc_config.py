@@ -0,0 +1,32 @@
+"""Checks how FMC instances are read out of adder.conf"""
+
+from __future__ import annotations
+from configparser import ConfigParser
+import devices.fmc as fmc_module
+import logging
+
+CONF: str = """
+[fmc]
+host = https://fmc.example.com
+dfw_ftd = dfw
+ord_ftd = ord
+
+[fmc:lab]
+host = https://fmc-lab.example.com
+dfw_ftd = lab-dfw
+
+[fmc:spare]
+host = None
+"""
+
+
+def test_incomplete_instance_is_skipped(monkeypatch, caplog):
+    config = ConfigParser()
+    config.read_string(CONF)
+    monkeypatch.setattr(fmc_module, "config", config)
+
+    with caplog.at_level(logging.ERROR, logger=fmc_module.__name__):
+        instances = fmc_module.load_fmc_instances()
+
+    assert [instance["name"] for instance in instances] == ["fmc"]
+    assert "[fmc:lab] is missing ord_ftd" in caplog.text
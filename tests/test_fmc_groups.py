@@ -0,0 +1,134 @@
+"""Checks what single group updates cost against the mock FMC, counted in requests, on a first run with nothing cached."""
+
+from __future__ import annotations
+from fmc_mock import MockFMC
+import devices.fmc as fmc_module
+import json
+import pytest
+
+INVENTORY_SIZE: int = 5000
+
+
+@pytest.fixture(autouse=True)
+def backups_dir(tmp_path, monkeypatch):
+    """Group backups are written to ./backups, so keep them out of the repo"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "backups").mkdir()
+
+
+@pytest.fixture
+def mock():
+    with MockFMC() as mock:
+        # A big inventory, so pulling it would show up as several extra page requests
+        for n in range(INVENTORY_SIZE):
+            mock.state.add_host(
+                f"192.0.{n // 250}.{n % 250}", f"192.0.{n // 250}.{n % 250}"
+            )
+        yield mock
+
+
+def connect(mock: MockFMC) -> fmc_module.AdderFMC:
+    return fmc_module.AdderFMC(
+        host=mock.url,
+        dfw_ftd="dfw",
+        ord_ftd="ord",
+        creds=("user", "password"),
+        rate_limit=100000,
+    )
+
+
+def count_requests(mock: MockFMC, action) -> dict[str, int]:
+    before = dict(mock.state.requests)
+    action()
+    return {
+        method: count - before.get(method, 0)
+        for method, count in mock.state.requests.items()
+        if count != before.get(method, 0)
+    }
+
+
+def test_literal_update_is_one_get_and_one_put(mock):
+    mock.state.add_host("10.0.0.9", "10.0.0.9", group_id="grp-1")
+    fmc = connect(mock)
+
+    added: list[str] = []
+    cost = count_requests(
+        mock,
+        lambda: added.extend(
+            fmc.update_group_literals("grp-1", ["10.0.0.1", "10.0.0.2", "10.0.0.9"])
+        ),
+    )
+
+    assert cost == {"GET": 1, "PUT": 1}
+    assert added == ["10.0.0.1", "10.0.0.2"]
+    assert mock.state.group_members("grp-1") == {"10.0.0.1", "10.0.0.2", "10.0.0.9"}
+
+
+def test_literal_update_finds_ip_held_by_renamed_host(mock):
+    mock.state.add_host("web01", "10.0.0.5", group_id="grp-1")
+    fmc = connect(mock)
+
+    added: list[str] = []
+    cost = count_requests(
+        mock,
+        lambda: added.extend(
+            fmc.update_group_literals("grp-1", ["10.0.0.5", "10.0.0.6"])
+        ),
+    )
+
+    # The group read, plus one filtered lookup for each IP that isn't in the group by name
+    assert cost == {"GET": 3, "PUT": 1}
+    assert added == ["10.0.0.6"]
+    assert mock.state.groups["grp-1"]["literals"] == [
+        {"type": "Host", "value": "10.0.0.6"}
+    ]
+
+
+def test_backup_holds_the_group_as_it_was_before_the_update(mock, tmp_path):
+    mock.state.add_host("10.0.0.9", "10.0.0.9", group_id="grp-1")
+    fmc = connect(mock)
+
+    fmc.update_group_literals("grp-1", ["10.0.0.1"])
+
+    backups = [
+        json.loads(path.read_text()) for path in (tmp_path / "backups").iterdir()
+    ]
+    assert len(backups) == 1
+    assert backups[0]["id"] == "grp-1"
+    assert backups[0]["description"] == "DIA addresses"
+    assert [obj["name"] for obj in backups[0]["objects"]] == ["10.0.0.9"]
+    assert "literals" not in backups[0]
+    assert mock.state.groups["grp-1"]["description"] == "DIA addresses"
+
+
+def test_removal_is_one_get_and_one_put(mock):
+    mock.state.add_host("10.0.0.1", "10.0.0.1", group_id="grp-1")
+    mock.state.add_host("10.0.0.2", "10.0.0.2", group_id="grp-1")
+    fmc = connect(mock)
+
+    removed: list = []
+    cost = count_requests(
+        mock,
+        lambda: removed.extend(fmc.remove_from_object_group("grp-1", ["10.0.0.1"])),
+    )
+
+    assert cost == {"GET": 1, "PUT": 1}
+    assert [obj.name for obj in removed[0]] == ["10.0.0.1"]
+    assert mock.state.group_members("grp-1") == {"10.0.0.2"}
+
+
+def test_removal_finds_ip_held_by_renamed_host(mock):
+    mock.state.add_host("web01", "10.0.0.5", group_id="grp-1")
+    mock.state.add_host("10.0.0.2", "10.0.0.2", group_id="grp-1")
+    fmc = connect(mock)
+
+    removed: list = []
+    cost = count_requests(
+        mock,
+        lambda: removed.extend(fmc.remove_from_object_group("grp-1", ["10.0.0.5"])),
+    )
+
+    # The group read, plus one filtered lookup for the IP
+    assert cost == {"GET": 2, "PUT": 1}
+    assert [obj.name for obj in removed[0]] == ["web01"]
+    assert mock.state.group_members("grp-1") == {"10.0.0.2"}
@@ -0,0 +1,76 @@
+"""Runs a crowd of concurrent adders against the mock FMC, all editing the same network group, and checks that
+no membership is lost along the way. Turn it up with the ADDER_STRESS_WORKERS, ADDER_STRESS_PUT_DELAY and
+ADDER_STRESS_VERIFY_DELAY environment variables, e.g. 40 workers with PUTs taking up to 0.3s.
+"""
+
+from __future__ import annotations
+from fmc_mock import MockFMC
+from threading import Thread
+import devices.fmc as fmc_module
+import os
+import pytest
+
+WORKERS: int = int(os.environ.get("ADDER_STRESS_WORKERS", "24"))
+PUT_DELAY: float = float(os.environ.get("ADDER_STRESS_PUT_DELAY", "0.1"))
+VERIFY_DELAY: float = float(os.environ.get("ADDER_STRESS_VERIFY_DELAY", "0.5"))
+STRAY_IP: str = "172.16.0.1"
+
+
+@pytest.fixture(autouse=True)
+def backups_dir(tmp_path, monkeypatch):
+    """Group backups are written to ./backups, so keep them out of the repo"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "backups").mkdir()
+
+
+def connect(mock: MockFMC, verify_updates: bool) -> fmc_module.AdderFMC:
+    return fmc_module.AdderFMC(
+        host=mock.url,
+        dfw_ftd="dfw",
+        ord_ftd="ord",
+        creds=("user", "password"),
+        rate_limit=100000,
+        verify_updates=verify_updates,
+    )
+
+
+def run_adder(mock: MockFMC, worker: int, done: list[list[str]], errors: list[str]):
+    """One adder run. Workers take turns adding their IPs as literals, as new host objects, or as literals
+    along with a stray IP that they then remove again, so adds and removals race each other.
+    """
+    ips = [f"10.{worker}.0.{n}" for n in range(1, 4)]
+    try:
+        fmc = connect(mock, verify_updates=True)
+        if worker % 3 == 0:
+            fmc.update_group_literals("grp-1", ips)
+        elif worker % 3 == 1:
+            fmc.update_object_group("grp-1", fmc.create_host_objects(ips))
+        else:
+            fmc.update_group_literals("grp-1", ips + [STRAY_IP])
+            fmc.remove_from_object_group("grp-1", [STRAY_IP])
+    except Exception as e:
+        errors.append(f"worker {worker}: {e!r}")
+    else:
+        done.append(ips)
+
+
+def test_concurrent_updates_lose_no_members(monkeypatch):
+    monkeypatch.setattr(fmc_module, "GROUP_VERIFY_DELAY", VERIFY_DELAY)
+    done: list[list[str]] = []
+    errors: list[str] = []
+
+    with MockFMC(put_delay=PUT_DELAY) as mock:
+        threads = [
+            Thread(target=run_adder, args=(mock, worker, done, errors))
+            for worker in range(WORKERS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        members = mock.state.group_members("grp-1")
+
+    expected = {ip for ips in done for ip in ips}
+    assert errors == []
+    assert len(done) == WORKERS
+    assert sorted(expected - members) == []
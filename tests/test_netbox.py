@@ -0,0 +1,79 @@
+"""Checks the batched prefix lookups against a stubbed pynetbox ipam endpoint, including batches that fail."""
+
+from __future__ import annotations
+from pynetbox.core.query import RequestError
+from types import SimpleNamespace
+from typing import Any
+import devices.netbox as netbox_module
+import pytest
+
+
+def request_error() -> RequestError:
+    response = SimpleNamespace(
+        status_code=500,
+        reason="Internal Server Error",
+        url="https://netbox/api/ipam/prefixes/",
+        text="oops",
+        request=SimpleNamespace(body=None),
+        json=lambda: {"detail": "oops"},
+    )
+    return RequestError(response)
+
+
+class StubPrefixes:
+    """Answers prefix filters from a dict of site -> prefix, failing the first `failures` queries"""
+
+    def __init__(self, prefixes: dict[str, str], failures: int = 0):
+        self.prefixes: dict[str, str] = prefixes
+        self.failures: int = failures
+        self.queries: list[list[str]] = []
+
+    def filter(self, site: list[str], **filters: Any) -> list[SimpleNamespace]:
+        self.queries.append(site)
+        if self.failures > 0:
+            self.failures -= 1
+            raise request_error()
+        return [
+            SimpleNamespace(site=SimpleNamespace(slug=code), prefix=self.prefixes[code])
+            for code in site
+            if code in self.prefixes
+        ]
+
+
+def stub_netbox(prefixes: StubPrefixes) -> netbox_module.AdderNetbox:
+    nb = object.__new__(netbox_module.AdderNetbox)
+    nb.prefix_cache = {}
+    nb.ipam = SimpleNamespace(prefixes=prefixes)
+    return nb
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    monkeypatch.setattr(netbox_module, "SITE_BATCH_SIZE", 2)
+
+
+def test_site_prefixes_are_cached(small_batches):
+    prefixes = StubPrefixes({"aaa": "10.0.0.0/24", "bbb": "10.0.1.0/24"})
+    nb = stub_netbox(prefixes)
+
+    assert nb.get_site_prefixes(["AAA", "bbb", "ccc"]) == {
+        "aaa": "10.0.0.0/24",
+        "bbb": "10.0.1.0/24",
+    }
+    assert nb.get_site_prefixes(["aaa", "ccc"]) == {"aaa": "10.0.0.0/24"}
+    assert prefixes.queries == [["aaa", "bbb"], ["ccc"]]
+
+
+def test_failed_batch_is_left_out_and_retried(small_batches):
+    prefixes = StubPrefixes(
+        {"aaa": "10.0.0.0/24", "bbb": "10.0.1.0/24", "ccc": "10.0.2.0/24"}, failures=1
+    )
+    nb = stub_netbox(prefixes)
+
+    assert nb.get_site_prefixes(["aaa", "bbb", "ccc"]) == {"ccc": "10.0.2.0/24"}
+    assert nb.get_site_prefixes(["aaa", "bbb", "ccc"]) == {
+        "aaa": "10.0.0.0/24",
+        "bbb": "10.0.1.0/24",
+        "ccc": "10.0.2.0/24",
+    }
+    assert prefixes.queries == [["aaa", "bbb"], ["ccc"], ["aaa", "bbb"]]
@@ -0,0 +1,63 @@
+"""Drives AdderSalt against the mock Salt REST API and checks what each master is sent and how failures are reported."""
+
+from __future__ import annotations
+from salt_mock import APPLIED, NO_MINIONS, STATE_FAILED, MockSalt
+import devices.salt as salt_module
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def creds(monkeypatch):
+    monkeypatch.setattr(salt_module, "SALT_USER", "user")
+    monkeypatch.setattr(salt_module, "SALT_PASS", "password")
+
+
+def connect(mock: MockSalt) -> salt_module.AdderSalt:
+    return salt_module.AdderSalt(
+        masters=[mock.master_url(master) for master in mock.state.outcomes],
+        target="fw*",
+    )
+
+
+def test_one_login_and_one_lowstate_per_master():
+    with MockSalt({"m1": APPLIED, "m2": APPLIED}) as mock:
+        salt = connect(mock)
+        results = salt.push(["10.0.0.2", "2001:db8::1", "10.0.0.1", "10.0.0.2"])
+
+    assert results == {
+        mock.master_url("m1"): "applied",
+        mock.master_url("m2"): "applied",
+    }
+    for master in ("m1", "m2"):
+        (login_path, login), (run_path, lowstate) = mock.state.requests[master]
+        assert login_path == "login"
+        assert login == {"username": "user", "password": "password", "eauth": "pam"}
+        assert run_path == ""
+        assert lowstate == [
+            {
+                "client": "local",
+                "tgt": "fw*",
+                "fun": "state.apply",
+                "arg": [salt_module.SALT_STATE],
+                "kwarg": {
+                    "pillar": {
+                        salt_module.SALT_PILLAR_KEY: {
+                            "ipv4": ["10.0.0.1", "10.0.0.2"],
+                            "ipv6": ["2001:db8::1"],
+                        }
+                    }
+                },
+            }
+        ]
+
+
+def test_failures_are_reported_per_master():
+    with MockSalt({"m1": APPLIED, "m2": NO_MINIONS, "m3": STATE_FAILED}) as mock:
+        salt = connect(mock)
+        results = salt.push(["10.0.0.1"])
+
+    assert results == {
+        mock.master_url("m1"): "applied",
+        mock.master_url("m2"): "failed: no minions matched",
+        mock.master_url("m3"): "failed on ['fw*']",
+    }
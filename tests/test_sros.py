@@ -0,0 +1,144 @@
+"""Drives AdderSROS against stand-in NETCONF sessions, with ncclient's manager.connect stubbed out, and checks
+what each router is sent and how failures on one router are kept from the others."""
+
+from __future__ import annotations
+from contextlib import contextmanager
+from ncclient.transport.errors import TransportError
+from threading import Lock
+from typing import Any
+import devices.sros as sros_module
+import pytest
+import time
+
+ROUTERS: list[str] = [f"pe{n}" for n in range(1, 7)]
+
+
+class FakeSession:
+    """Records every NETCONF operation sent to one router. Commits fail when fail_commit is set."""
+
+    def __init__(self, host: str, network: FakeNetwork):
+        self.host: str = host
+        self.network: FakeNetwork = network
+        self.connected: bool = True
+        self.calls: list[str] = []
+
+    @contextmanager
+    def locked(self, target: str):
+        self.calls.append(f"lock {target}")
+        try:
+            yield
+        finally:
+            self.calls.append(f"unlock {target}")
+
+    def edit_config(self, target: str, config: str) -> None:
+        self.calls.append(f"edit-config {target}")
+        self.network.enter()
+        try:
+            time.sleep(0.05)
+        finally:
+            self.network.leave()
+
+    def commit(self) -> None:
+        self.calls.append("commit")
+        if self.host in self.network.fail_commit:
+            raise TransportError(f"commit failed on {self.host}")
+
+    def discard_changes(self) -> None:
+        self.calls.append("discard-changes")
+
+    def close_session(self) -> None:
+        self.connected = False
+
+
+class FakeNetwork:
+    """Stands in for manager.connect, handing out one FakeSession per router and tracking how many routers
+    are being edited at the same time."""
+
+    def __init__(
+        self,
+        fail_connect: frozenset[str] = frozenset(),
+        fail_commit: frozenset[str] = frozenset(),
+    ):
+        self.fail_connect: frozenset[str] = fail_connect
+        self.fail_commit: frozenset[str] = fail_commit
+        self.sessions: dict[str, FakeSession] = {}
+        self.active: int = 0
+        self.peak: int = 0
+        self.lock: Lock = Lock()
+
+    def connect(self, host: str, **kwargs: Any) -> FakeSession:
+        if host in self.fail_connect:
+            raise TransportError(f"no route to {host}")
+        session = FakeSession(host, self)
+        self.sessions[host] = session
+        return session
+
+    def enter(self) -> None:
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def leave(self) -> None:
+        with self.lock:
+            self.active -= 1
+
+
+@pytest.fixture(autouse=True)
+def creds(monkeypatch):
+    monkeypatch.setattr(sros_module, "SROS_USER", "user")
+    monkeypatch.setattr(sros_module, "SROS_PASS", "password")
+
+
+def connect(
+    monkeypatch, network: FakeNetwork, max_workers: int = 8
+) -> sros_module.AdderSROS:
+    monkeypatch.setattr(sros_module.manager, "connect", network.connect)
+    return sros_module.AdderSROS(routers=ROUTERS, max_workers=max_workers)
+
+
+def test_one_locked_edit_and_commit_per_router(monkeypatch):
+    network = FakeNetwork()
+    sros = connect(monkeypatch, network)
+
+    results = sros.push(["10.0.0.1", "2001:db8::1"])
+
+    assert results == {host: "committed" for host in ROUTERS}
+    for host in ROUTERS:
+        assert network.sessions[host].calls == [
+            "lock candidate",
+            "edit-config candidate",
+            "commit",
+            "unlock candidate",
+        ]
+
+
+def test_failed_commit_is_discarded_and_kept_to_its_router(monkeypatch):
+    network = FakeNetwork(
+        fail_connect=frozenset({"pe2"}), fail_commit=frozenset({"pe4"})
+    )
+    sros = connect(monkeypatch, network)
+
+    results = sros.push(["10.0.0.1"])
+
+    assert results["pe2"].startswith("connection failed")
+    assert results["pe4"].startswith("failed")
+    assert network.sessions["pe4"].calls == [
+        "lock candidate",
+        "edit-config candidate",
+        "commit",
+        "discard-changes",
+        "unlock candidate",
+    ]
+    for host in set(ROUTERS) - {"pe2", "pe4"}:
+        assert results[host] == "committed"
+        assert "discard-changes" not in network.sessions[host].calls
+
+
+def test_routers_updated_at_once_stay_within_max_workers(monkeypatch):
+    network = FakeNetwork()
+    sros = connect(monkeypatch, network, max_workers=2)
+
+    results = sros.push(["10.0.0.1"])
+
+    assert list(results.values()) == ["committed"] * len(ROUTERS)
+    assert network.peak == 2
@@ -1,13 +1,25 @@
 from __future__ import annotations
+from configparser import ConfigParser
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Iterable
+import atexit
 import ipaddress
 import logging
+import queue
 
 # Logging enable
 logger = logging.getLogger(__name__)
 
+# Read in configuration data from config.ini
+config = ConfigParser()
+config.read("adder.conf")
+
+# Longest request/response body, in characters, that will be written to the logs
+LOG_BODY_LENGTH: int = config.getint("logging", "max_body_length", fallback=1024)
+
 
 class SomethingBroke(Exception):
-    """Something doesn't work like I wanted! >:( """
+    """Something doesn't work like I wanted! >:("""
 
     def __init__(self, broke_thing, message="Something Broke"):
         self.broke_thing = broke_thing
@@ -32,7 +44,8 @@ class StatusCodeError(SomethingBroke):
 
     def __init__(self, status_code, message="HTTP status code indicates API error"):
         self.status_code = status_code
-        self.message = message
+        # Error responses can carry whole request bodies back, so keep the message to the log body length
+        self.message = str(BodySummary(message))
         super().__init__(self.status_code, self.message)
 
 
@@ -85,6 +98,32 @@ class IPOverlapWarning(SomethingBroke):
         super().__init__(self.dia_ips, self.message)
 
 
+class GroupUpdateConflictError(SomethingBroke):
+    """Exception raised when an object group keeps being changed by someone else, and an update to it can't be made to stick"""
+
+    def __init__(
+        self,
+        group,
+        message="Object group was modified concurrently and the update could not be applied",
+    ):
+        self.group = group
+        self.message = message
+        super().__init__(self.group, self.message)
+
+
+class EmptyObjectGroupError(SomethingBroke):
+    """Exception raised when a change would leave an object group with no members, which the FMC won't accept"""
+
+    def __init__(
+        self,
+        group,
+        message="Object group would be left empty. Remove it or add another member first",
+    ):
+        self.group = group
+        self.message = message
+        super().__init__(self.group, self.message)
+
+
 class ObjectNotFoundWarning(SomethingBroke):
     """Exception raised when failing to query an object-group name for its UUID"""
 
@@ -122,4 +161,63 @@ def validate_ip(ip: str) -> bool:
     except ValueError:
         raise InvalidIPArgumentError(ip, message=f"Invalid IP detected: {ip}")
     else:
-        return True
\ No newline at end of file
+        return True
+
+
+class BodySummary:
+    """Wraps a request or response body so it is only rendered if the log record is actually emitted.
+    Bodies longer than max_length are cut down, and lists are summarized by their number of items.
+    """
+
+    __slots__ = ("body", "max_length")
+
+    def __init__(self, body: Any, max_length: int = LOG_BODY_LENGTH):
+        self.body = body
+        self.max_length = max_length
+
+    def __str__(self) -> str:
+        body = self.body
+        if isinstance(body, bytes):
+            text = body[: self.max_length + 1].decode("utf-8", errors="replace")
+            truncated = len(body) > self.max_length
+        elif isinstance(body, (list, tuple)):
+            # Render items one at a time so a 5,000 item bulk body is never turned into one giant string
+            rendered: list[str] = []
+            length = 0
+            for item in body:
+                if length > self.max_length:
+                    break
+                rendered.append(str(item))
+                length += len(rendered[-1]) + 2
+            text = f"[{', '.join(rendered)}]"
+            truncated = len(rendered) < len(body) or len(text) > self.max_length
+            if truncated:
+                text = f"<{len(body)} items> {text}"
+        else:
+            text = str(body)
+            truncated = len(text) > self.max_length
+
+        if truncated:
+            return f"{text[: self.max_length]}... (truncated)"
+        return text
+
+
+def queue_logging(logger_names: Iterable[str]) -> QueueListener:
+    """Moves the handlers of the named loggers behind a single queue. Loggers only put records on the queue, and a
+    background thread does the formatting and file/console writes. Returns the running listener, which is stopped at exit.
+    """
+    log_queue: queue.Queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    handlers: list[logging.Handler] = []
+
+    for name in logger_names:
+        named_logger = logging.getLogger(name)
+        for handler in named_logger.handlers:
+            if handler not in handlers:
+                handlers.append(handler)
+        named_logger.handlers = [queue_handler]
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener